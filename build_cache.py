@@ -0,0 +1,112 @@
+from __future__ import print_function
+import os
+import hashlib
+import time
+from dolfin.cpp.common import mpi_comm_world, MPI, info
+from dolfin.cpp.io import HDF5File
+from dolfin.cpp.la import as_backend_type, PETScMatrix
+from dolfin.cpp.mesh import Mesh, MeshFunction
+from petsc4py import PETSc
+
+# On-disk cache of data built during initialization, used to speed up repeated runs (e.g. sweeps over dt or factor)
+# cache/[mesh]_np[number of processes]_[signature]/mesh.hdf5       partitioned mesh and facet function
+# cache/[mesh]_np[number of processes]_[signature]/[key]/*.petsc   assembled constant matrices (PETSc binary format)
+#   signature is hash of modification times of mesh source files, key is hash of arguments in matrix_args
+#   files are renamed from temporary names when complete, so concurrent jobs never read partially written file
+# Matrices are loaded with the same row distribution and local-to-global mapping as assembled ones, because the mesh
+# partition is read from the cache too and dof numbering is deterministic for given partition.
+
+cache_dir = 'cache'
+# arguments influencing assembled constant matrices (forms, spaces and boundary conditions), other arguments are not
+# part of the key (new solver or problem options need to be added here only if they change assembled matrices)
+matrix_args = ['problem', 'solver', 'mesh', 'dt', 'nu', 'bc', 'r', 'B', 'fo', 'laplace', 'stab', 'bcv', 'ema', 'cs',
+               'cbcDelta', 'ffc', 'qcap']
+
+
+def mesh_signature(mesh_name):
+    """hash of modification times and sizes of mesh source files (cache is rebuilt when mesh is regenerated)"""
+    files = ['meshes/' + mesh_name + suffix for suffix in ['.hdf5', '.xml', '_facet_region.xml']]
+    stats = [(f, os.path.getmtime(f), os.path.getsize(f)) for f in files if os.path.exists(f)]
+    return hashlib.md5(str(stats)).hexdigest()[:8]
+
+
+class BuildCache(object):
+    def __init__(self, args):
+        self.comm = mpi_comm_world()
+        self.MPI_rank = MPI.rank(self.comm)
+        self.mesh_dir = os.path.join(cache_dir, '%s_np%d_%s' % (args.mesh, MPI.size(self.comm),
+                                                                 mesh_signature(args.mesh)))
+        self.mesh_file = os.path.join(self.mesh_dir, 'mesh.hdf5')
+        options = sorted((key, str(value)) for key, value in vars(args).iteritems() if key in matrix_args)
+        self.key = hashlib.md5(str(options)).hexdigest()[:12]
+        self.matrix_dir = os.path.join(self.mesh_dir, self.key)
+        # files are written under temporary names and renamed when complete (other jobs may read the cache)
+        self.tmp_suffix = '.tmp%d_%d' % (MPI.max(self.comm, os.getpid()), int(MPI.max(self.comm, time.time())*1e3))
+        if self.MPI_rank == 0:
+            try:
+                os.makedirs(self.matrix_dir)
+            except OSError:  # already exists (possibly created by another job)
+                pass
+            with open(os.path.join(self.matrix_dir, 'options.txt'), 'w') as f:
+                for (key, value) in options:
+                    f.write('%s %s\n' % (key, value))
+        MPI.barrier(self.comm)
+        info('Using build cache %s' % self.matrix_dir)
+
+    def has_mesh(self):
+        return os.path.exists(self.mesh_file)
+
+    def commit(self, path):
+        """renames completely written temporary file to path"""
+        MPI.barrier(self.comm)
+        if self.MPI_rank == 0:
+            os.rename(path + self.tmp_suffix, path)
+        MPI.barrier(self.comm)
+
+    def save_mesh(self, mesh, facet_function):
+        f = HDF5File(self.comm, self.mesh_file + self.tmp_suffix, 'w')
+        f.write(mesh, 'mesh')  # partition is saved too
+        f.write(facet_function, 'facet_function')
+        f.close()
+        self.commit(self.mesh_file)
+
+    def load_mesh(self):
+        f = HDF5File(self.comm, self.mesh_file, 'r')
+        mesh = Mesh()
+        f.read(mesh, 'mesh', True)  # use partition from file
+        facet_function = MeshFunction("size_t", mesh)
+        f.read(facet_function, 'facet_function')
+        f.close()
+        info('Loaded partitioned mesh from build cache.')
+        return mesh, facet_function
+
+    def matrix_file(self, name):
+        return os.path.join(self.matrix_dir, name + '.petsc')
+
+    def has_matrix(self, name):
+        return os.path.exists(self.matrix_file(name))
+
+    def save_matrix(self, name, matrix):
+        viewer = PETSc.Viewer().createBinary(self.matrix_file(name) + self.tmp_suffix, 'w', comm=PETSc.COMM_WORLD)
+        as_backend_type(matrix).mat().view(viewer)
+        viewer.destroy()
+        if self.MPI_rank == 0 and os.path.exists(self.matrix_file(name) + self.tmp_suffix + '.info'):
+            os.remove(self.matrix_file(name) + self.tmp_suffix + '.info')  # PETSc viewer options, not needed
+        self.commit(self.matrix_file(name))
+
+    def load_matrix(self, name, space):
+        """loads square matrix assembled on FunctionSpace space"""
+        dofmap = space.dofmap()
+        begin, end = dofmap.ownership_range()
+        mat = PETSc.Mat().create(PETSc.COMM_WORLD)
+        mat.setSizes(((end - begin, space.dim()), (end - begin, space.dim())))
+        mat.setType(PETSc.Mat.Type.AIJ)
+        viewer = PETSc.Viewer().createBinary(self.matrix_file(name), 'r', comm=PETSc.COMM_WORLD)
+        mat.load(viewer)
+        viewer.destroy()
+        # needed by DirichletBC.apply() and assembling into matrix copy (both use local indices)
+        lgmap = PETSc.LGMap().create(dofmap.tabulate_local_to_global_dofs().astype(PETSc.IntType),
+                                     comm=PETSc.COMM_WORLD)
+        mat.setLGMap(lgmap, lgmap)
+        info('Loaded matrix %s from build cache.' % name)
+        return PETScMatrix(mat)
@@ -0,0 +1,139 @@
+from __future__ import print_function
+import os
+import numpy as np
+from dolfin.cpp.common import MPI, mpi_comm_world
+
+# Compressed output of saved fields (GeneralProblem option --output hdf5), alternative to dolfin XDMFFile:
+#   values in mesh vertices (P2 velocity is written as P1) are stored as float32 in chunked gzip compressed HDF5
+#   datasets, optionally quantized (only --quantize leading bits of mantissa are kept, the rest is zeroed so it
+#   compresses well), grid of each step is appended to [name].xdmf index (before closing tags), so files can be
+#   opened in ParaView any time
+#   data are gathered to process 0, which writes them (h5py is needed only with this output)
+#   one VertexMesh is needed for every mesh (e.g. volume mesh and boundary mesh for WSS), files should be closed by close()
+#   see output_benchmark.py for comparison with XDMFFile
+
+
+class VertexMesh(object):
+    """mesh gathered to process 0 (geometry and topology in global vertex numbering)"""
+    def __init__(self, mesh):
+        comm = mpi_comm_world()
+        self.rank = MPI.rank(comm)
+        self.comm = comm.tompi4py() if MPI.size(comm) > 1 else None
+        self.mesh = mesh
+        self.num_vertices = mesh.size_global(0)
+        self.global_indices = mesh.topology().global_indices(0)
+        cells = self.global_indices[mesh.cells()]
+        parts = self.gather((self.global_indices, mesh.coordinates()))
+        if self.rank == 0:
+            self.geometry = np.zeros((self.num_vertices, mesh.geometry().dim()))
+            for (indices, coordinates) in parts:
+                self.geometry[indices] = coordinates
+            self.topology = np.vstack(self.gather(cells)).astype(np.int32)
+        else:
+            self.gather(cells)
+        if self.comm is not None:
+            self.all_indices = self.comm.gather(self.global_indices, root=0)
+
+    def gather(self, data):
+        """returns list of data of all processes on process 0"""
+        return self.comm.gather(data, root=0) if self.comm is not None else [data]
+
+    def vertex_values(self, function):
+        """returns values of function in all vertices (vertices x components) on process 0, None elsewhere"""
+        if function.function_space().mesh().id() != self.mesh.id():
+            raise RuntimeError('Function %s is not defined on mesh of this VertexMesh.' % function.name())
+        values = function.compute_vertex_values(self.mesh)
+        values = values.reshape((-1, len(self.global_indices))).T
+        parts = self.gather(values)
+        if self.rank != 0:
+            return None
+        if self.comm is None:
+            return values
+        result = np.zeros((self.num_vertices, values.shape[1]))
+        for (indices, part) in zip(self.all_indices, parts):
+            result[indices] = part
+        return result
+
+
+class CompressedFile(object):
+    """replacement of XDMFFile for series of functions (file << function)"""
+    xdmf_cell_types = {2: 'Triangle', 3: 'Tetrahedron'}
+    xdmf_header = '''<?xml version="1.0"?>
+<Xdmf Version="2.0" xmlns:xi="http://www.w3.org/2001/XInclude">
+  <Domain>
+    <Grid Name="TimeSeries" GridType="Collection" CollectionType="Temporal">
+'''
+    xdmf_footer = '''    </Grid>
+  </Domain>
+</Xdmf>
+'''
+
+    def __init__(self, vertex_mesh, file_name, quantize=0, compression=4):
+        self.vertex_mesh = vertex_mesh
+        self.file_name = file_name
+        self.quantize = quantize
+        self.compression = compression
+        self.parameters = {}  # only for compatibility with XDMFFile
+        self.steps = 0
+        self.h5 = None
+        if vertex_mesh.rank == 0:
+            import h5py
+            self.h5 = h5py.File(file_name + '.h5', 'w')
+            self.h5.create_dataset('mesh/geometry', data=vertex_mesh.geometry, compression='gzip')
+            self.h5.create_dataset('mesh/topology', data=vertex_mesh.topology, compression='gzip')
+            with open(file_name + '.xdmf', 'w') as xdmf:
+                xdmf.write(self.xdmf_header)
+                self.footer_position = xdmf.tell()
+                xdmf.write(self.xdmf_footer)
+
+    def reduce_precision(self, values):
+        values = values.astype(np.float32)
+        if 0 < self.quantize < 23:
+            # round to given number of mantissa bits (float32 has 23)
+            drop = 23 - self.quantize
+            bits = values.view(np.uint32)
+            bits += np.uint32(1 << (drop - 1))
+            bits &= np.uint32(~((1 << drop) - 1) & 0xFFFFFFFF)
+        return values
+
+    def __lshift__(self, function):
+        values = self.vertex_mesh.vertex_values(function)
+        if values is None:
+            return
+        name = function.name()
+        self.h5.create_dataset('%s/%d' % (name, self.steps), data=self.reduce_precision(values),
+                               chunks=True, compression='gzip', compression_opts=self.compression, shuffle=True)
+        self.h5.flush()
+        self.append_grid(name, values.shape[1])
+        self.steps += 1
+
+    def append_grid(self, name, components):
+        """writes grid of last step over closing tags of index (which are written again after it)"""
+        geometry, topology = self.vertex_mesh.geometry, self.vertex_mesh.topology
+        h5_name = os.path.basename(self.file_name) + '.h5'
+        grid = '''      <Grid Name="mesh" GridType="Uniform">
+        <Topology NumberOfElements="%d" TopologyType="%s">
+          <DataItem Format="HDF" DataType="Int" Dimensions="%d %d">%s:/mesh/topology</DataItem>
+        </Topology>
+        <Geometry GeometryType="%s">
+          <DataItem Format="HDF" Dimensions="%d %d">%s:/mesh/geometry</DataItem>
+        </Geometry>
+        <Time Value="%d" />
+        <Attribute Name="%s" AttributeType="%s" Center="Node">
+          <DataItem Format="HDF" NumberType="Float" Precision="4" Dimensions="%d %d">%s:/%s/%d</DataItem>
+        </Attribute>
+      </Grid>
+''' % (len(topology), self.xdmf_cell_types[topology.shape[1] - 1], len(topology), topology.shape[1], h5_name,
+       'XYZ' if geometry.shape[1] == 3 else 'XY', len(geometry), geometry.shape[1], h5_name, self.steps, name,
+       'Scalar' if components == 1 else 'Vector', len(geometry), components, h5_name, name, self.steps)
+        with open(self.file_name + '.xdmf', 'r+') as xdmf:
+            xdmf.seek(self.footer_position)
+            xdmf.write(grid)
+            self.footer_position = xdmf.tell()
+            xdmf.write(self.xdmf_footer)
+
+    def close(self):
+        """closes HDF5 file (index is complete after every step)"""
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
@@ -1,80 +1,97 @@
 from __future__ import print_function
 
-from dolfin import *
 import csv
-import sys
+import argparse
+from multiprocessing import Pool
+import numpy as np
 from scipy.special import jv
-from sympy import re, im, sqrt, symbols, lambdify, besselj, sympify
 
 __author__ = 'jh'
 
-note = ''  # to append name of precomputed solution modification
-fname = 'tmp.csv'
-R = 1.5
-# read coeficients from chosen file
-infile = open(fname, 'r')
-csvreader = csv.reader(infile, delimiter=',')
-n_coefs = csvreader.next()[0]
-coefs_mult = [sympify(i.replace('*^', 'E')) for i in csvreader.next()]
-coefs_bes_mult = [sympify(i.replace('*^', 'E')) for i in csvreader.next()]
-coefs_bes = [sympify(i.replace('*^', 'E')) for i in csvreader.next()]
-coef_par_max = csvreader.next()[0]
-coef_par = csvreader.next()[0]
-
-# for meshName in ['cyl_d1', 'cyl_d2', 'cyl_d3', 'cyl_e3']:
-#for meshName in ['cyl_c1', 'cyl_c2', 'cyl_c3']:
-for meshName in ['cyl15_3']:
-    print('Mesh: '+meshName)
-    mesh = Mesh("meshes/" + meshName + ".xml")
-    cell_function = MeshFunction("size_t", mesh, "meshes/" + meshName + "_physical_region.xml")
-    facet_function = MeshFunction("size_t", mesh, "meshes/" + meshName + "_facet_region.xml")
-
-    PS = FunctionSpace(mesh, "Lagrange", 2)  # partial solution (must be same order as V)
-
-    f = HDF5File(mpi_comm_world(), 'precomputed/precomputed_'+meshName+note+'.hdf5', 'w')
-
-    # precomputation of Bessel functions=============================================================================
-    temp = toc()
-    coefs_r_prec = []  # these will be functions in PS
-    coefs_i_prec = []  # these will be functions in PS
-    c0ex = Expression("(maxc-c*(x[0]*x[0]+x[1]*x[1]))", maxc=Constant(coef_par_max), c=Constant(coef_par))
-    f.write(interpolate(c0ex, PS), "parab")
-    # plot(interpolate(c0ex, PS), interactive=True, title='Parab')
+# Precomputes partial solutions (modes) of Womersley flow used by womersley_cylinder problem
+# for each mesh and viscosity variant (note) creates precomputed/precomputed_[mesh][note].hdf5 containing
+#   parab, real0..real7, imag0..imag7: functions in P2 space
+# coefficients are read from file given by --coefs pattern (default tmp[note].csv), e.g. tmp.csv, tmpnuL10.csv
+# modes are evaluated with NumPy at coordinates of all P2 dofs at once (same as interpolation of Expression)
+#   python generate.py cyl_c1 cyl_c2 cyl_c3 --notes '' nuL10 nuL100 nuH10
+# dolfin is imported only in worker processes (one process for each mesh)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('meshes', help='mesh names', nargs='+')
+parser.add_argument('--notes', help='viscosity variants (appended to name of precomputed solution)', nargs='+',
+                    default=[''])
+parser.add_argument('--coefs', help='pattern of coefficient file names', type=str, default='tmp%s.csv')
+parser.add_argument('-R', help='cylinder radius', type=float, default=5.0)
+parser.add_argument('-p', '--processes', help='number of processes', type=int, default=4)
+
+
+def parse_number(string):
+    # Mathematica output, e.g. '(0.000735686 - 0.000528035*I)' or '1.2*^-3'
+    return complex(eval(string.replace('*^', 'E'), {'__builtins__': {}}, {'I': 1j}))
+
+
+def read_coefficients(fname):
+    infile = open(fname, 'r')
+    csvreader = csv.reader(infile, delimiter=',')
+    next(csvreader)  # number of coefficients
+    coefs = {
+        'mult': np.array([parse_number(i) for i in next(csvreader)]),
+        'bes_mult': np.array([parse_number(i) for i in next(csvreader)]),
+        'bes': np.array([parse_number(i) for i in next(csvreader)]),
+        'par_max': parse_number(next(csvreader)[0]).real,
+        'par': parse_number(next(csvreader)[0]).real,
+    }
+    infile.close()
+    return coefs
+
+
+def compute_modes(coefs, x, R):
+    """returns dictionary {dataset name: values in points x} for all modes"""
+    rad2 = x[:, 0]*x[:, 0] + x[:, 1]*x[:, 1]
+    rad = np.sqrt(rad2)
+    on_wall = np.abs(rad - R) < 3e-16  # near(rad, R) in dolfin, do not evaluate on boundaries, it's 0
+    modes = {'parab': coefs['par_max'] - coefs['par']*rad2}
     for i in range(8):
-        r = symbols('r')
-        besRe = re(coefs_mult[i] * (coefs_bes_mult[i] * besselj(0, r * coefs_bes[i]) + 1))
-        besIm = im(coefs_mult[i] * (coefs_bes_mult[i] * besselj(0, r * coefs_bes[i]) + 1))
-        besRe_lambda = lambdify(r, besRe, ['numpy', {'besselj': jv}])
-        besIm_lambda = lambdify(r, besIm, ['numpy', {'besselj': jv}])
-
-
-        class PartialReSolution(Expression):
-            def eval(self, value, x):
-                rad = float(sqrt(x[0] * x[0] + x[1] * x[1]))
-                # conversion to float needed, u_lambda (and near) cannot use sympy Float as input
-                value[0] = 0 if near(rad, R) else besRe_lambda(rad)  # do not evaluate on boundaries, it's 0
-                # print(value) gives reasonable values
-
-
-        expr = PartialReSolution()
-        print('i = '+str(i)+'   interpolating real part')
-        # plot(interpolate(expr, PS), interactive=True, title='Real%d'%i)
-        f.write(interpolate(expr, PS), "real%d" % i)
-
-
-        class PartialImSolution(Expression):
-            def eval(self, value, x):
-                rad = float(sqrt(x[0] * x[0] + x[1] * x[1]))
-                # conversion to float needed, u_lambda (and near) cannot use sympy Float as input
-                value[0] = 0 if near(rad, R) else besIm_lambda(rad)  # do not evaluate on boundaries, it's 0
-
-
-        expr = PartialImSolution()
-        print('i = '+str(i)+'   interpolating imaginary part')
-        # plot(interpolate(expr, PS), interactive=True, title='Imag%d'%i)
-        f.write(interpolate(expr, PS), "imag%d" % i)
-        #exit()
-
-    print("Precomputed partial solution functions. Time: %f" % (toc() - temp))
-
-
+        values = coefs['mult'][i] * (coefs['bes_mult'][i] * jv(0, rad * coefs['bes'][i]) + 1)
+        values[on_wall] = 0
+        modes['real%d' % i] = values.real
+        modes['imag%d' % i] = values.imag
+    return modes
+
+
+def generate(job):
+    mesh_name, notes, coef_files, R = job
+    from dolfin import Function, FunctionSpace
+    from dolfin.cpp.common import mpi_comm_world, toc
+    from dolfin.cpp.io import HDF5File
+    from problems.general_problem import GeneralProblem
+
+    print('Mesh: '+mesh_name)
+    mesh, facet_function = GeneralProblem.loadMesh(mesh_name)
+    PS = FunctionSpace(mesh, "Lagrange", 2)  # partial solution (must be same order as V)
+    x = PS.dofmap().tabulate_all_coordinates(mesh).reshape((-1, mesh.geometry().dim()))
+    fce = Function(PS)
+    for note in notes:
+        temp = toc()
+        modes = compute_modes(read_coefficients(coef_files[note]), x, R)
+        f = HDF5File(mpi_comm_world(), 'precomputed/precomputed_'+mesh_name+note+'.hdf5', 'w')
+        for name in ['parab'] + ['%s%d' % (part, i) for i in range(8) for part in ['real', 'imag']]:
+            fce.vector().set_local(modes[name])
+            fce.vector().apply('insert')
+            f.write(fce, name)
+        f.close()
+        print("Precomputed partial solution functions for %s%s. Time: %f" % (mesh_name, note, toc() - temp))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    coef_files = dict((note, args.coefs % note) for note in args.notes)
+    jobs = [(m, args.notes, coef_files, args.R) for m in args.meshes]
+    if args.processes > 1 and len(jobs) > 1:
+        pool = Pool(min(args.processes, len(jobs)), maxtasksperchild=1)
+        pool.map(generate, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        for job in jobs:
+            generate(job)
@@ -1,21 +1,29 @@
 from __future__ import print_function
 import csv, os
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # figures are rendered in worker processes, no display needed
 import matplotlib.pyplot as plt
 import argparse
 import problem as prb
 import math
-import numpy
+from multiprocessing import Pool
 __author__ = 'jh'
 
 # global variables
 characteristics = []
 ch_index = {}
-problems = {}
 problem_list = []
 characteristics_seconds = []
 characteristics_timelines = []
 times = {}
+# merged data parsed into NumPy arrays indexed by [factor, mesh, dt] (index 0 is not used, so indices are the same
+# as in run names), one array for each problem (see load_general_reports() for description)
+reports = {}
+h_values = {}
+cycles = {}
+seconds = {}
+timelines = {}
 
 color_set = 'Set1'   # e. g. 'Set1', 'Dark2', 'brg', 'jet'
 dpi = 300
@@ -25,6 +33,8 @@ meshes = range(1, 4)
 dts = range(1, 6)
 dtToMs = {1: 100, 2: 50, 3: 10, 4: 5, 5: 1}
 dtToSteps = {1: 10, 2: 20, 3: 100, 4: 200, 5: 1000}  # time steps per second
+dt_ms = np.array([dtToMs[t] for t in dts], dtype=float)
+grid_shape = (max(factors) + 1, max(meshes) + 1, max(dts) + 1)
 
 
 def savefig(figure, path, lgd, **kwargs):
@@ -43,7 +53,44 @@ def color(color_number, color_range):
     return plt.get_cmap(color_set)(np.linspace(0, 1.0, color_range))[color_number]
 
 
+def parse_name(name):
+    """splits run name into (problem, factor, mesh, dt), e. g. 'IBC_I135' >> ('IBC_I', 1, 3, 5)"""
+    return name[0:5], int(name[5]), int(name[6]), int(name[7])
+
+
+def index_records(records):
+    """returns dictionary {(problem, factor, mesh, dt, characteristic): row} for structured array records"""
+    return dict(((r['problem'], r['factor'], r['mesh'], r['dt'], r['characteristic']), i)
+                for i, r in enumerate(records))
+
+
+def fixed_length(values, length):
+    """returns array of float values truncated or padded with NaN to given length"""
+    row = np.fromiter((float(x) for x in values[:length]), dtype=float)
+    return np.pad(row, (0, length - row.size), 'constant', constant_values=np.nan)
+
+
+def read_value_rows(csvreader, length):
+    """reads rows of file with header [name, what, abbreviation, values...]
+    returns structured array of row indices and 2D array of values (shorter rows are padded with NaN)"""
+    index_rows = []
+    value_rows = []
+    for line in csvreader:
+        try:
+            index_rows.append(parse_name(line[0]) + (line[2],))
+        except (ValueError, IndexError):
+            print('  Skipping row with unexpected name:', line[0])
+            continue
+        value_rows.append(fixed_length(line[3:], length))
+    records = np.array(index_rows, dtype=[('problem', 'U5'), ('factor', 'i4'), ('mesh', 'i4'), ('dt', 'i4'),
+                                          ('characteristic', 'U16')])
+    values = np.vstack(value_rows) if value_rows else np.zeros((0, length))
+    return records, values
+
+
 # load general reports =========================================================================
+# reports[problem] is array of shape (factors, meshes, dts, characteristics) filled with NaN where no run was found
+# h_values[problem] and cycles[problem] are arrays of shape (factors, meshes, dts) with metadata of runs
 def load_general_reports():
     csvfile = open('done_merged.csv', 'r')
     csvreader = csv.reader(csvfile, delimiter=';', escapechar='|')
@@ -56,18 +103,30 @@ def load_general_reports():
             characteristics.append('time')
             ch_index['time'] = header.index(item)
     print('Loaded characteristics:', characteristics)
+    rows = []
     for line in csvreader:
         # collect names of problems (first five chars of parameter "name")
-        problem_name = line[0][0:5]
-        report_list = []
-        for value in line[2:]:
-            report_list.append(float(value))
-        if problem_name not in problems:
-            problems[problem_name] = {line[0]: {'report': report_list, 'md': prb.load_metadata(line[1])}}
+        try:
+            problem_name, f, m, t = parse_name(line[0])
+        except (ValueError, IndexError):
+            print('  Skipping report with unexpected name:', line[0])
+            continue
+        md = prb.load_metadata(line[1])
+        rows.append((problem_name, f, m, t, md['h'], md['cycles'], fixed_length(line[2:], len(header))))
+        if problem_name not in problem_list:
             problem_list.append(problem_name)
-        else:
-            problems[problem_name][line[0]] = {'report': report_list, 'md': prb.load_metadata(line[1])}
     csvfile.close()
+    records = np.array(rows, dtype=[('problem', 'U5'), ('factor', 'i4'), ('mesh', 'i4'), ('dt', 'i4'), ('h', 'f8'),
+                                    ('cycles', 'i4'), ('report', 'f8', (len(header),))])
+    for problem_name in problem_list:
+        mask = records['problem'] == problem_name
+        idx = (records['factor'][mask], records['mesh'][mask], records['dt'][mask])
+        reports[problem_name] = np.full(grid_shape + (len(header),), np.nan)
+        reports[problem_name][idx] = records['report'][mask]
+        h_values[problem_name] = np.full(grid_shape, np.nan)
+        h_values[problem_name][idx] = records['h'][mask]
+        cycles[problem_name] = np.zeros(grid_shape, dtype=int)
+        cycles[problem_name][idx] = records['cycles'][mask]
     print('Loaded problems:', problem_list)
 
 
@@ -79,46 +138,59 @@ def load_seconds_data():
     l = len(seconds_list)
     seconds_list = [int(x) for x in seconds_list[3:l]]
     print(seconds_list)
-    for line in csvreader:
-        data_place = problems[line[0][0:5]][line[0]]
-        data_list = [float(x) for x in line[3:l]]
-        if 'seconds' in data_place:
-            data_place['seconds'][line[2]] = data_list
-        else:
-            data_place['seconds'] = {line[2]: data_list}
-        if not line[2] in characteristics_seconds:
-            characteristics_seconds.append(line[2])
+    records, values = read_value_rows(csvreader, len(seconds_list))
     csvfile.close()
+    seconds.update({'seconds': seconds_list, 'records': records, 'values': values, 'index': index_records(records)})
+    characteristics_seconds.extend(np.unique(records['characteristic']).tolist())
     print('Characteristics for second-lines:', characteristics_seconds)
 
 
 # time lines - load data =========================================================================
+# timelines[dt] = {'records': structured array (problem, factor, mesh, dt, characteristic) for rows of 'values',
+#                  'values': 2D array of values in times[dt], 'index': {(problem, f, m, dt, ch): row}}
 def load_timelines_data():
-    for i in range(1, 6):
+    for i in dts:
         csvfile = open('done_merged_time_lines%d.csv' % i, 'r')
         csvreader = csv.reader(csvfile, delimiter=';', escapechar='|')
         try:
             line = next(csvreader)
-            times[i] = [float(x) for x in line[3:]]
-            # print(times[i])
-            for line in csvreader:
-                data_place = problems[line[0][0:5]][line[0]]
-                data_list = [float(x) for x in line[3:]]
-                if 'timelines' in data_place:
-                    data_place['timelines'][line[2]] = data_list
-                else:
-                    data_place['timelines'] = {line[2]: data_list}
-                if not line[2] in characteristics_timelines:
-                    characteristics_timelines.append(line[2])
+            times[i] = np.array([float(x) for x in line[3:]])
+            records, values = read_value_rows(csvreader, times[i].size)
+            timelines[i] = {'records': records, 'values': values, 'index': index_records(records)}
+            for ch in np.unique(records['characteristic']).tolist():
+                if ch not in characteristics_timelines:
+                    characteristics_timelines.append(ch)
         except StopIteration:
             print('  File empty.')
         csvfile.close()
     print('Characteristics for time-lines:', characteristics_timelines)
 
 
+def get_timeline(problem_name, f, m, t, ch):
+    """returns values of characteristic ch for given run or None if not found"""
+    if t not in timelines:
+        return None
+    row = timelines[t]['index'].get((problem_name, f, m, t, ch))
+    return None if row is None else timelines[t]['values'][row]
+
+
+def render_plots(plots, function, processes):
+    """renders all plots from dictionary plots by function(plot_name) using pool of worker processes"""
+    # plots (containing lambda labels) are inherited by forked workers, only names are sent to them
+    names = sorted(plots.keys())
+    if processes > 1 and len(names) > 1:
+        pool = Pool(processes)
+        pool.map(function, names, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        for name in names:
+            function(name)
+
+
 # create convergence plots =========================================================================
 # default characteristics: ['time', 'CE_L2r', 'CE_H1r', 'CE_H1wr', 'PEn', 'TE_L2r', 'TE_H1r', 'TE_H1wr', 'PTEn', 'FEr']
-def create_convergence_plots():
+def create_convergence_plot(plot_name):
     formats3 = [['x-.', '+--', '1-'],
                 ['+-.', 'x--', '2-']]
     line_widths3 = [2.0, 1.5, 1.0]
@@ -126,91 +198,71 @@ def create_convergence_plots():
     line_width5 = 1.0
     marker_size = 10.0
     marker_edge_width = 2.0
-    for (plot_name, plot) in c_plots.iteritems():
-        print(plot_name)
-        figT = plt.figure(1)
-        figS = plt.figure(2)
-        splT = figT.add_subplot('111')
-        splS = figS.add_subplot('111')
-        plot_empty = True
-        max_ = -1e16
-        min_ = 1e16
-        for ch in plot['characteristics']:
-            max_plotted_value = 10 if str(ch).endswith('r') else 1e10
-            for prb in plot['problems']:
-                indices = {'problems': prb, 'characteristics': ch}
-                for f in plot['factors']:
-                    for m in meshes:
-                        Tvalues = []
-                        Tx = []
-                        for t in dts:
-                            name = prb + ('%d%d%d' % (f, m, t))
-                            print('  Looking for:', name)
-                            if name in problems[prb]:
-                                print('    Found!')
-                                d = problems[prb][name]
-                                value = d['report'][ch_index[ch]]
-                                if 0 < value < max_plotted_value:  # do not plot values 0 and from diverging problems
-                                    Tvalues.append(value)
-                                    Tx.append(dtToMs[t])
-                                    min_, max_ = minmax(min_, max_, value, value)
-                        if Tvalues:
-                            plot_empty = False
-                            idx = plot[plot['colors']].index(indices[plot['colors']])
-                            rng = len(plot[plot['colors']])
-                            splT.plot(Tx, Tvalues, formats3[idx % 2][m-1], lw=line_widths3[m-1],
-                                      label=plot['label'](prb, f, ch, m, t) + ' on mesh %d' % m, color=color(idx, rng),
-                                      ms=marker_size, mew=marker_edge_width)
-                    for t in dts:
-                        Svalues = []
-                        Sx = []
-                        for m in meshes:
-                            name = prb + ('%d%d%d' % (f, m, t))
-                            print('  Looking for:', name)
-                            if name in problems[prb]:
-                                print('    Found!')
-                                d = problems[prb][name]
-                                value = d['report'][ch_index[ch]]
-                                if 0 < value < max_plotted_value:  # do not plot values 0 and from diverging problems
-                                    Svalues.append(value)
-                                    Sx.append(d['md']['h'])
-                        if Svalues:
-                            idx = plot[plot['colors']].index(indices[plot['colors']])
-                            rng = len(plot[plot['colors']])
-                            splS.plot(Sx, Svalues, formats5[t-1], lw=line_width5,
-                                      label=plot['label'](prb, f, ch, m, t) + ' with dt=%d' % dtToMs[t],
-                                      color=color(idx, rng), ms=marker_size, mew=marker_edge_width)
-        if not plot_empty:
-            print('  Plotting')
-            for a in [figT.axes[0], figS.axes[0]]:
-                a.set_title(plot_name)
-                a.set_xscale('log')
-                a.set_yscale('log')
-                a.set_ylim(min_*0.95, max_*1.05)
-                # TODO add ticks and ticklabels for min and max values
-                #a.set_yticks(a.get_yticks().tolist() + [min_, max_])
-                #a.set_yticklabels(a.get_yticklabels().extend([min_, max_]))
-            axesT = figT.axes[0]
-            splT.set_xlabel('dt in ms')
-            splT.set_xlim(100.5, 0.95)
-            lgdT = axesT.legend(bbox_to_anchor=(1.5, 1.0))
-            savefig(figT, 'plots/C_' + plot_name + '_CT.png', lgdT)
-
-            axesS = figS.axes[0]
-            splS.set_xlabel('h')
-            splS.set_xlim(2.3, 0.5)
-            axesS.set_xticks([2.0, 1.0, 0.5])
-            axesS.set_xticklabels(['2.0', '1.0', '0.5'])
-            lgdS = axesS.legend(bbox_to_anchor=(1.5, 1.0))
-            savefig(figS, 'plots/C_' + plot_name + '_CS.png', lgdS)
-
-        plt.figure(1)
-        plt.close()
-        plt.figure(2)
-        plt.close()
-
-
-def create_timelines_plots():
+    plot = c_plots[plot_name]
+    print(plot_name)
+    figT = plt.figure()
+    figS = plt.figure()
+    splT = figT.add_subplot('111')
+    splS = figS.add_subplot('111')
+    plot_empty = True
+    max_ = -1e16
+    min_ = 1e16
+    for ch in plot['characteristics']:
+        max_plotted_value = 10 if str(ch).endswith('r') else 1e10
+        for prb in plot['problems']:
+            indices = {'problems': prb, 'characteristics': ch}
+            idx = plot[plot['colors']].index(indices[plot['colors']])
+            rng = len(plot[plot['colors']])
+            for f in plot['factors']:
+                # values for all meshes and dts at once, shape (meshes, dts)
+                values = reports[prb][f, meshes[0]:meshes[-1] + 1, dts[0]:dts[-1] + 1, ch_index[ch]]
+                h = h_values[prb][f, meshes[0]:meshes[-1] + 1, dts[0]:dts[-1] + 1]
+                with np.errstate(invalid='ignore'):
+                    # do not plot values 0 and from diverging problems (NaN marks missing runs)
+                    valid = (values > 0) & (values < max_plotted_value)
+                if not valid.any():
+                    continue
+                plot_empty = False
+                min_, max_ = minmax(min_, max_, values[valid].min(), values[valid].max())
+                for i, m in enumerate(meshes):
+                    if valid[i].any():
+                        splT.plot(dt_ms[valid[i]], values[i][valid[i]], formats3[idx % 2][m-1], lw=line_widths3[m-1],
+                                  label=plot['label'](prb, f, ch, m, dts[-1]) + ' on mesh %d' % m,
+                                  color=color(idx, rng), ms=marker_size, mew=marker_edge_width)
+                for j, t in enumerate(dts):
+                    if valid[:, j].any():
+                        splS.plot(h[:, j][valid[:, j]], values[:, j][valid[:, j]], formats5[t-1], lw=line_width5,
+                                  label=plot['label'](prb, f, ch, meshes[-1], t) + ' with dt=%d' % dtToMs[t],
+                                  color=color(idx, rng), ms=marker_size, mew=marker_edge_width)
+    if not plot_empty:
+        print('  Plotting', plot_name)
+        for a in [figT.axes[0], figS.axes[0]]:
+            a.set_title(plot_name)
+            a.set_xscale('log')
+            a.set_yscale('log')
+            a.set_ylim(min_*0.95, max_*1.05)
+            # TODO add ticks and ticklabels for min and max values
+            #a.set_yticks(a.get_yticks().tolist() + [min_, max_])
+            #a.set_yticklabels(a.get_yticklabels().extend([min_, max_]))
+        axesT = figT.axes[0]
+        splT.set_xlabel('dt in ms')
+        splT.set_xlim(100.5, 0.95)
+        lgdT = axesT.legend(bbox_to_anchor=(1.5, 1.0))
+        savefig(figT, 'plots/C_' + plot_name + '_CT.png', lgdT)
+
+        axesS = figS.axes[0]
+        splS.set_xlabel('h')
+        splS.set_xlim(2.3, 0.5)
+        axesS.set_xticks([2.0, 1.0, 0.5])
+        axesS.set_xticklabels(['2.0', '1.0', '0.5'])
+        lgdS = axesS.legend(bbox_to_anchor=(1.5, 1.0))
+        savefig(figS, 'plots/C_' + plot_name + '_CS.png', lgdS)
+
+    plt.close(figT)
+    plt.close(figS)
+
+
+def create_timelines_plot(plot_name):
     formats = {2: ['--', '-'],
                3: ['-.', '--', '-'],
                4: [':', '-.', '--', '-']
@@ -219,64 +271,66 @@ def create_timelines_plots():
                    3: [2.0, 1.5, 1.0],
                    4: [2.5, 2.0, 1.5, 1.0]
                    }
-    for (plot_name, plot) in t_plots.iteritems():
-        print(plot_name)
-        fig = plt.figure(1)
-        s1 = fig.add_subplot('121')
-        s2 = fig.add_subplot('122')
-        plot_empty = True
-        max_ = -1e16
-        min_ = 1e16
-        max_l = -1e16
-        min_l = 1e16
-        for ch in plot['characteristics']:
-            for prb in plot['problems']:
-                for f in plot['factors']:
-                    for t in plot['times']:
-                        for m in plot['meshes']:
-                            indices = {'meshes': m-1, 'times': t-1, 'problems': plot['problems'].index(prb),
-                                       'characteristics': plot['characteristics'].index(ch)}
-                            name = prb + ('%d%d%d' % (f, m, t))
-                            print('  Looking for:', name)
-                            if name in problems[prb] and ch in problems[prb][name]['timelines']:
-                                print('    Found!')
-                                d = problems[prb][name]
-                                y = d['timelines'][ch]
-                                x = times[t]
-                                min_, max_ = minmax(min_, max_, min(y[dtToSteps[t]:]), max(y[dtToSteps[t]:]))
-                                min_l, max_l = minmax(min_l, max_l, min(y[(d['md']['cycles']-1)*dtToSteps[t]:]), max(y[(d['md']['cycles']-1)*dtToSteps[t]:]))
-                                plot_empty = False
-                                s2.set_yscale('log')
-                                for s in [s1, s2]:
-                                    s.plot(x, y, formats[len(plot[plot['formats']])][indices[plot['formats']]],
-                                           label=plot['label'](prb, f, ch, m, t),
-                                           color=color(indices[plot['colors']], len(plot[plot['colors']])),
-                                           lw=line_widths[len(plot[plot['formats']])][indices[plot['formats']]])
-        if not plot_empty:
-            print('  Plotting')
-            for s in [s1, s2]:
-                s.set_xlabel('time')
-                s.set_xlim(0, d['md']['cycles'])
-            min_log = math.pow(10, math.floor(math.log10(min_)))
-            s1.set_ylim(min_, max_)
-            s2.set_ylim(min_log, max_)
-            s2.set_title(plot_name + ' for factor=' + f_str[f])
-            lgd = plt.legend(bbox_to_anchor=(1.0 + plot['legend size'], 1.0))
-            savefig(plt.gcf(), 'plots/TL_' + plot_name + '_f%d' % f + '.png', lgd)
-            # save same plot only for last cycle
-            for s in [s1, s2]:
-                s.set_xlabel('time (last cycle)')
-                s.set_xlim((d['md']['cycles']-1), d['md']['cycles'])
-            min_log = math.pow(10, math.floor(math.log10(min_l)))
-            s1.set_ylim(min_l, max_l)
-            s2.set_ylim(min_log, max_l)
-            savefig(plt.gcf(), 'plots/TL_' + plot_name + '_f%d' % f + 'lc.png', lgd)
-        plt.close()
+    plot = t_plots[plot_name]
+    print(plot_name)
+    fig = plt.figure()
+    s1 = fig.add_subplot('121')
+    s2 = fig.add_subplot('122')
+    plot_empty = True
+    max_ = -1e16
+    min_ = 1e16
+    max_l = -1e16
+    min_l = 1e16
+    n_cycles = 0
+    for ch in plot['characteristics']:
+        for prb in plot['problems']:
+            for f in plot['factors']:
+                for t in plot['times']:
+                    for m in plot['meshes']:
+                        indices = {'meshes': m-1, 'times': t-1, 'problems': plot['problems'].index(prb),
+                                   'characteristics': plot['characteristics'].index(ch)}
+                        y = get_timeline(prb, f, m, t, ch)
+                        if y is None:
+                            continue
+                        n_cycles = cycles[prb][f, m, t]
+                        min_, max_ = minmax(min_, max_, np.nanmin(y[dtToSteps[t]:]), np.nanmax(y[dtToSteps[t]:]))
+                        last_cycle = y[(n_cycles-1)*dtToSteps[t]:]
+                        min_l, max_l = minmax(min_l, max_l, np.nanmin(last_cycle), np.nanmax(last_cycle))
+                        plot_empty = False
+                        s2.set_yscale('log')
+                        sampled = ~np.isnan(y)  # errors need not be computed in every step (see --ecschedule)
+                        for s in [s1, s2]:
+                            s.plot(times[t][sampled], y[sampled], formats[len(plot[plot['formats']])][indices[plot['formats']]],
+                                   label=plot['label'](prb, f, ch, m, t),
+                                   color=color(indices[plot['colors']], len(plot[plot['colors']])),
+                                   lw=line_widths[len(plot[plot['formats']])][indices[plot['formats']]])
+    if not plot_empty:
+        print('  Plotting', plot_name)
+        f = plot['factors'][-1]
+        for s in [s1, s2]:
+            s.set_xlabel('time')
+            s.set_xlim(0, n_cycles)
+        min_log = math.pow(10, math.floor(math.log10(min_)))
+        s1.set_ylim(min_, max_)
+        s2.set_ylim(min_log, max_)
+        s2.set_title(plot_name + ' for factor=' + f_str[f])
+        lgd = s2.legend(bbox_to_anchor=(1.0 + plot['legend size'], 1.0))
+        savefig(fig, 'plots/TL_' + plot_name + '_f%d' % f + '.png', lgd)
+        # save same plot only for last cycle
+        for s in [s1, s2]:
+            s.set_xlabel('time (last cycle)')
+            s.set_xlim((n_cycles-1), n_cycles)
+        min_log = math.pow(10, math.floor(math.log10(min_l)))
+        s1.set_ylim(min_l, max_l)
+        s2.set_ylim(min_log, max_l)
+        savefig(fig, 'plots/TL_' + plot_name + '_f%d' % f + 'lc.png', lgd)
+    plt.close(fig)
 
 
 # MAIN code ========================================================================================
 parser = argparse.ArgumentParser()
 parser.add_argument('-dir', help='working directory', type=str, default=".")
+parser.add_argument('-p', '--processes', help='number of processes used to render figures', type=int, default=4)
 args = parser.parse_args()
 print(args)
 os.chdir(args.dir)
@@ -329,7 +383,7 @@ for (ch_name, chs) in compare_params.iteritems():
                 'colors': 'characteristics', 'factors': [f],
                 'label': lambda prb, f, ch, m, t: '%s' % ch
             }
-create_convergence_plots()
+render_plots(c_plots, create_convergence_plot, args.processes)
 
 # define plots:
 # plot: one parameter, one problem, one factor, 3 meshes, 5 dts
@@ -387,7 +441,7 @@ for ch in ['CE_H1r', 'PEn', 'FEr']:
                     'legend size': 1.0
                 }
 
-create_timelines_plots()
+render_plots(t_plots, create_timelines_plot, args.processes)
 
 
 # reports over seconds - generate plots =========================================================================
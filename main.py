@@ -14,7 +14,7 @@ from time_control import TimeControl
 parser = argparse.ArgumentParser()
 parser.add_argument('problem', help='Which problem to solve', choices=['womersley_cylinder', 'steady_cylinder',
                                                                        'FaC3D_benchmark', 'real'])
-parser.add_argument('solver', help='Which solver to use', choices=['ipcs1', 'direct'])
+parser.add_argument('solver', help='Which solver to use', choices=['ipcs1', 'ipcs_ab', 'direct'])
 parser.add_argument('mesh', help='Mesh name')
 parser.add_argument('time', help='Total time', type=float)
 parser.add_argument('dt', help='Time step', type=float)
@@ -103,5 +103,5 @@ info(out.get(r, 'UNCAUGHT ERROR IN SOLVE METHOD'))
 
 if rank==0:
     info('Post-processing')
-    postprocessing.rewrite_xdmf_files(metadata)
+    # vectors in .xdmf files are already named (GeneralProblem.write_xdmf), no rewriting is needed
     postprocessing.create_scripts(metadata)
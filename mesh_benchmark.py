@@ -0,0 +1,53 @@
+from __future__ import print_function
+import os
+import argparse
+from dolfin.cpp.common import mpi_comm_world, MPI, tic, toc, info
+from dolfin.cpp.io import HDF5File
+from dolfin.cpp.mesh import Mesh, MeshFunction
+
+# compares loading time of xml and hdf5 (converted by mesh_convert.py) meshes, e.g.:
+#   python mesh_benchmark.py bench3D_1
+#   mpirun -n 8 python mesh_benchmark.py bench3D_1
+# reported time is maximum over processes (time until all processes have their part of the mesh)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('mesh', help='Mesh name')
+parser.add_argument('-n', '--repeat', help='number of repetitions', type=int, default=3)
+args = parser.parse_args()
+comm = mpi_comm_world()
+
+
+def load_xml():
+    mesh = Mesh('meshes/' + args.mesh + '.xml')
+    facet_function = MeshFunction("size_t", mesh, 'meshes/' + args.mesh + '_facet_region.xml')
+    return mesh, facet_function
+
+
+def load_hdf5():
+    f = HDF5File(comm, 'meshes/' + args.mesh + '.hdf5', 'r')
+    mesh = Mesh()
+    f.read(mesh, 'mesh', False)
+    facet_function = MeshFunction("size_t", mesh)
+    f.read(facet_function, 'facet_function')
+    f.close()
+    return mesh, facet_function
+
+
+results = []
+for (name, load, path) in [('xml', load_xml, 'meshes/' + args.mesh + '.xml'),
+                           ('hdf5', load_hdf5, 'meshes/' + args.mesh + '.hdf5')]:
+    if not os.path.exists(path):
+        info('%s not found, skipping' % path)
+        continue
+    times = []
+    for i in range(args.repeat):
+        MPI.barrier(comm)
+        tic()
+        mesh, facet_function = load()
+        times.append(MPI.max(comm, toc()))
+    results.append((name, min(times), sum(times)/len(times), mesh.num_cells()))
+
+if MPI.rank(comm) == 0:
+    print('Mesh %s on %d process(es):' % (args.mesh, MPI.size(comm)))
+    for (name, best, average, cells) in results:
+        print('  %-5s best %8.3f s average %8.3f s (cells on process 0: %d)' % (name, best, average, cells))
@@ -1,25 +1,50 @@
-from dolfin import *
+from __future__ import print_function
+import os
+import argparse
+from dolfin.cpp.common import mpi_comm_world, info
+from dolfin.cpp.io import HDF5File
+from dolfin.cpp.mesh import Mesh, MeshFunction
 
-# to convert xml mesh with facet function to hdf5
-meshes = ['cyl_c3']
+# to convert xml mesh with facet function (and physical region cell function) to hdf5:
+#   python mesh_convert.py cyl_c3 bench3D_1
+#   python mesh_convert.py          (all xml meshes in meshes/ without up-to-date hdf5 file)
+# hdf5 meshes are read in parallel by GeneralProblem.loadMesh(), which prefers them to xml meshes
 
-for m in meshes:
-    mesh = Mesh('meshes/' + m + '.xml')
-    cell_function = MeshFunction("size_t", mesh, "meshes/" + m + "_physical_region.xml")
-    facet_function = MeshFunction("size_t", mesh, "meshes/" + m + "_facet_region.xml")
 
-    f = HDF5File(mpi_comm_world(), 'meshes/'+m+'.hdf5', 'w')
+def xml_meshes():
+    return sorted(f[:-4] for f in os.listdir('meshes') if f.endswith('.xml') and not f.endswith('_region.xml'))
+
+
+def is_converted(mesh_name):
+    """hdf5 file exists and is newer than all xml source files"""
+    hdf5 = 'meshes/' + mesh_name + '.hdf5'
+    if not os.path.exists(hdf5):
+        return False
+    sources = ['meshes/' + mesh_name + suffix for suffix in ['.xml', '_facet_region.xml', '_physical_region.xml']]
+    return all(os.path.getmtime(hdf5) >= os.path.getmtime(f) for f in sources if os.path.exists(f))
+
+
+def convert(mesh_name, force=False):
+    if is_converted(mesh_name) and not force:
+        info('Mesh %s already converted.' % mesh_name)
+        return
+    info('Converting mesh %s' % mesh_name)
+    mesh = Mesh('meshes/' + mesh_name + '.xml')
+    facet_function = MeshFunction("size_t", mesh, "meshes/" + mesh_name + "_facet_region.xml")
+
+    f = HDF5File(mpi_comm_world(), 'meshes/' + mesh_name + '.hdf5', 'w')
     f.write(mesh, 'mesh')
     f.write(facet_function, 'facet_function')
+    if os.path.exists("meshes/" + mesh_name + "_physical_region.xml"):
+        cell_function = MeshFunction("size_t", mesh, "meshes/" + mesh_name + "_physical_region.xml")
+        f.write(cell_function, 'cell_function')
     f.close()
 
-    f = HDF5File(mpi_comm_world(), 'meshes/'+m+'.hdf5', 'r')
-    mesh = Mesh()
-    f.read(mesh, 'mesh', False)
-    facet_function = MeshFunction("size_t", mesh)
-    f.read(facet_function, 'facet_function')
-    # mesh = Mesh('meshes/' + m + '.hdf5')
-    plot(mesh)
-    plot(facet_function)
-    interactive()
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('meshes', help='mesh names (default: all xml meshes)', nargs='*')
+    parser.add_argument('-f', '--force', help='convert even if hdf5 file is up to date', action='store_true')
+    args = parser.parse_args()
+    for m in args.meshes or xml_meshes():
+        convert(m, args.force)
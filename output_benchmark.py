@@ -0,0 +1,87 @@
+from __future__ import print_function
+import os
+import argparse
+from dolfin import Expression, VectorFunctionSpace, FunctionSpace, interpolate
+from dolfin.cpp.common import mpi_comm_world, MPI, tic, toc
+from dolfin.cpp.io import XDMFFile
+
+from compressed_output import VertexMesh, CompressedFile
+from problems.general_problem import GeneralProblem
+
+# compares dolfin XDMFFile and compressed HDF5 output (--output hdf5) of P2 velocity and P1 pressure, e.g.:
+#   python output_benchmark.py cyl_c3 -n 20 --quantize 0 12 8
+#   mpirun -n 8 python output_benchmark.py cyl_c3
+# reports write time (maximum over processes), size of .xdmf and .h5 files and time of reading all datasets by h5py
+# (data read by ParaView), written files in output_benchmark/ can be opened in ParaView to check them
+
+parser = argparse.ArgumentParser()
+parser.add_argument('mesh', help='Mesh name')
+parser.add_argument('-n', '--steps', help='number of saved steps', type=int, default=10)
+parser.add_argument('--quantize', help='tested numbers of kept mantissa bits (0 for all)', type=int, nargs='+',
+                    default=[0, 12])
+args = parser.parse_args()
+comm = mpi_comm_world()
+directory = 'output_benchmark'
+if MPI.rank(comm) == 0 and not os.path.exists(directory):
+    os.mkdir(directory)
+MPI.barrier(comm)
+
+mesh = GeneralProblem.loadMesh(args.mesh)[0]
+V = VectorFunctionSpace(mesh, 'Lagrange', 2)
+Q = FunctionSpace(mesh, 'Lagrange', 1)
+velocity_expr = Expression(('sin(t+x[1])', 'cos(t*x[0])', '1.0 - x[0]*x[0] - x[1]*x[1] + 0.1*sin(t)'), t=0.0)
+pressure_expr = Expression('x[2]*cos(t)', t=0.0)
+# fields of all steps are prepared before, so only writing is timed
+fields = []
+for step in range(args.steps):
+    velocity_expr.t = pressure_expr.t = 0.1*step
+    velocity = interpolate(velocity_expr, V)
+    pressure = interpolate(pressure_expr, Q)
+    velocity.rename('velocity', 'velocity')
+    pressure.rename('pressure', 'pressure')
+    fields.append((velocity, pressure))
+
+
+def xdmf_file(name):
+    f = XDMFFile(comm, name + '.xdmf')
+    f.parameters['rewrite_function_mesh'] = False
+    return f
+
+
+def read_time(name):
+    import h5py
+    tic()
+    h5 = h5py.File(name + '.h5', 'r')
+    h5.visititems(lambda key, item: item[()] if isinstance(item, h5py.Dataset) else None)
+    h5.close()
+    return toc()
+
+
+variants = [('xdmf', xdmf_file, 'xdmf')]
+vertex_mesh = VertexMesh(mesh)
+for bits in args.quantize:
+    variants.append(('hdf5 %d bits' % bits if bits else 'hdf5 float32',
+                     lambda name, bits=bits: CompressedFile(vertex_mesh, name, bits), 'hdf5_%d' % bits))
+
+results = []
+for (label, create, suffix) in variants:
+    names = [directory + '/velocity_' + suffix, directory + '/pressure_' + suffix]
+    files = [create(name) for name in names]
+    MPI.barrier(comm)
+    tic()
+    for (velocity, pressure) in fields:
+        files[0] << velocity
+        files[1] << pressure
+    for f in files:
+        if isinstance(f, CompressedFile):
+            f.close()
+    del files  # closes XDMFFiles
+    write = MPI.max(comm, toc())
+    if MPI.rank(comm) == 0:
+        size = sum(os.path.getsize(name + extension) for name in names for extension in ['.xdmf', '.h5'])
+        results.append((label, write, size, sum(read_time(name) for name in names)))
+
+if MPI.rank(comm) == 0:
+    print('Mesh %s, %d steps on %d process(es):' % (args.mesh, args.steps, MPI.size(comm)))
+    for (label, write, size, read) in results:
+        print('  %-14s write %8.3f s  size %10.2f MB  read %8.3f s' % (label, write, size/1048576., read))
@@ -4,44 +4,69 @@ __author__ = 'jh'
 
 import os
 import re
+import argparse
+from multiprocessing import Pool
 
-regex = re.compile('"f_')
+regex = re.compile(b'Name="(f_[0-9]+)"')
 
 
-def rewrite_xdmf_files(metadata):
-    """changes xdmf vector name "f_something" into something like "IBC_I111velocity_diff" """
-    # NT could be done by function.rename('desired name','label') in FEniCS, applied to functions in GeneralProblem
-    os.chdir(metadata['dir'])
-    for f in os.listdir('.'):
-        if f.endswith('xdmf'):
-            name = f[5:-5]
-            print('Rewriting file: %-40s new vector name:' % f, name)
-            os.rename(f, 'temp')
-            try:
-                reader = open('temp', 'r')
-                writer = open(f, 'w')
-                for line in reader:
-                    if re.search(regex, line):
-                        s = line.split('\"')
-                        newline = line.replace(s[1], name)
-                    else:
-                        newline = line
-                    writer.write(newline)
-                reader.close()
-                writer.close()
-            except IOError:
-                print('IOError:', f)
+def rename_xdmf_file(path, name):
+    """changes xdmf vector name "f_something" into name (e.g. "IBC_I111velocity_diff") without copying the file
+    New names are written at byte offsets of old ones. If new name does not fit into place of old name, only the part
+    of the file behind the first old name is rewritten.
+    Returns number of renamed vectors."""
+    new_name = name.encode('ascii')
+    with open(path, 'r+b') as f:
+        data = f.read()
+        matches = list(regex.finditer(data))
+        if not matches:
+            return 0
+        if all(len(m.group(1)) >= len(new_name) for m in matches):
+            # pad with whitespace behind closing quote (between XML attributes) to keep the file length
+            for m in matches:
+                f.seek(m.start(1))
+                f.write(new_name + b'"' + b' ' * (len(m.group(1)) - len(new_name)))
+        else:
+            first = matches[0].start(0)
+            f.seek(first)
+            f.write(regex.sub(b'Name="' + new_name + b'"', data[first:]))
+            f.truncate()
+    return len(matches)
+
+
+def _rename_xdmf_file(args):
+    path, name = args
     try:
-        os.remove('temp')
-    except OSError:
-        print('temp file already removed')
+        count = rename_xdmf_file(path, name)
+        print('Rewritten file: %-40s new vector name: %s (%d occurrences)' % (path, name, count))
+    except IOError:
+        print('IOError:', path)
+
+
+def rewrite_xdmf_files(metadata, processes=4):
+    """changes xdmf vector name "f_something" into something like "IBC_I111velocity_diff" in all files in results
+    directory (only needed for results computed before functions were renamed in GeneralProblem.write_xdmf())"""
+    rewrite_xdmf_dir(metadata['dir'], processes)
+
+
+def rewrite_xdmf_dir(directory, processes=4):
+    # file name is [problem code]_[vector name].xdmf
+    jobs = [(os.path.join(directory, f), f[5:-5]) for f in os.listdir(directory) if f.endswith('xdmf')]
+    if processes > 1 and len(jobs) > 1:
+        pool = Pool(min(processes, len(jobs)))
+        pool.map(_rename_xdmf_file, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        for job in jobs:
+            _rename_xdmf_file(job)
 
 
 def create_scripts(metadata):
-    abspath = os.path.abspath(os.curdir)
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paraview_scripts')
     if metadata['hasTentativeV']:
-        template = open('../paraview_scripts/template_compare_vel_tent_cor.py', 'r')
-        out_file = open('compare_vel_tent.py', 'w')
+        template = open(os.path.join(template_dir, 'template_compare_vel_tent_cor.py'), 'r')
+        out_file = open(os.path.join(metadata['dir'], 'compare_vel_tent.py'), 'w')
         for line in template:
             fac = 1.0
             if 'factor' in metadata:
@@ -55,8 +80,8 @@ def create_scripts(metadata):
         template.close()
         out_file.close()
     else:
-        template = open('../paraview_scripts/template_velocity.py', 'r')
-        out_file = open('show_vel.py', 'w')
+        template = open(os.path.join(template_dir, 'template_velocity.py'), 'r')
+        out_file = open(os.path.join(metadata['dir'], 'show_vel.py'), 'w')
         for line in template:
             fac = 1.0
             if 'factor' in metadata:
@@ -68,3 +93,12 @@ def create_scripts(metadata):
         template.close()
         out_file.close()
 
+
+if __name__ == '__main__':
+    # rename vectors in .xdmf files of older results: python postprocessing.py WCYL_test_results [...]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dirs', help='results directories', nargs='+')
+    parser.add_argument('-p', '--processes', help='number of processes', type=int, default=4)
+    args = parser.parse_args()
+    for d in args.dirs:
+        rewrite_xdmf_dir(d, args.processes)
@@ -3,11 +3,12 @@ from __future__ import print_function
 from dolfin import interpolate, Expression, assemble
 from dolfin.cpp.common import mpi_comm_world
 from dolfin.cpp.io import HDF5File
-from dolfin.cpp.mesh import Mesh, FacetFunction, facets, edges, vertices
+from dolfin.cpp.mesh import Mesh, FacetFunction
 from dolfin.functions import FacetNormal, FunctionSpace
 from ufl import Measure, dx
 
 import itertools, csv
+import numpy as np
 
 meshName = 'HYK'
 
@@ -34,19 +35,17 @@ number_list = [2, 3, 4, 5]  # numbers of inflows, outflows, '1' is reserved for
 # END OF INPUT ==============================
 mesh = Mesh("meshes/" + meshName + ".xml")
 tdim = mesh.topology().dim()
-mesh.init(tdim-1, tdim)  # needed for facet.exterior()
+mesh.init(1)  # edges
+mesh.init(tdim-1)  # facets and cell-facet connectivity
 normal = FacetNormal(mesh)
 print("Mesh name: ", meshName, "    ", mesh)
 print("Mesh norm max: ", mesh.hmax())
 print("Mesh norm min: ", mesh.hmin())
-edge_min = 1000
-edge_max = 0
-for e in edges(mesh):
-    l = e.length()
-    if l > edge_max:
-        edge_max = l
-    if l < edge_min:
-        edge_min = l
+coordinates = mesh.coordinates()
+edge_vertices = mesh.topology()(1, 0)().reshape(-1, 2)
+edge_lengths = np.linalg.norm(coordinates[edge_vertices[:, 0]] - coordinates[edge_vertices[:, 1]], axis=1)
+edge_min = edge_lengths.min()
+edge_max = edge_lengths.max()
 print('edge length max/min:', edge_max, edge_min)
 tol = edge_min/10.
 
@@ -58,25 +57,31 @@ def vec(list1, list2):
 # vector product of normal and center gives d in ax+by+cz = d equation
 for obj in itertools.chain(inflows, outflows):
     obj['d'] = vec(obj['center'], obj['normal'])
+planes = list(itertools.chain(inflows, outflows))
+plane_normals = np.array([obj['normal'] for obj in planes])
+plane_d = np.array([obj['d'] for obj in planes])
+plane_numbers = np.array([obj['number'] for obj in planes])
 
 
-# returns number of plane the given point is in
-def point_in_subdomain(p):
-    for obj in itertools.chain(inflows, outflows):
-        if abs(vec(p, obj['normal']) - obj['d']) < tol:
-            return obj['number']
+# returns numbers of planes the given points are in (0 if point is not in any plane)
+# (first plane is chosen if point is in more planes)
+def points_in_subdomains(points):
+    in_plane = np.abs(points.dot(plane_normals.T) - plane_d) < tol
+    return np.where(in_plane.any(axis=1), plane_numbers[in_plane.argmax(axis=1)], 0)
 
 # Create boundary markers
+# exterior facets are facets of only one cell
+facet_vertices = mesh.topology()(tdim-1, 0)().reshape(mesh.num_facets(), -1)
+cell_facets = mesh.topology()(tdim, tdim-1)()
+exterior = np.flatnonzero(np.bincount(cell_facets, minlength=mesh.num_facets()) == 1)
+# all vertices of facet must be in the same plane (from number_list), otherwise facet is a wall
+vertex_numbers = points_in_subdomains(coordinates)[facet_vertices[exterior]]
+same_plane = (vertex_numbers == vertex_numbers[:, :1]).all(axis=1) & \
+             (vertex_numbers[:, :1] == np.array(number_list)).any(axis=1)
+markers = np.zeros(mesh.num_facets(), dtype=np.uintp)
+markers[exterior] = np.where(same_plane, vertex_numbers[:, 0], 1)   # 1 is wall
 facet_function = FacetFunction("size_t", mesh)
-for f_mesh in facets(mesh):
-    if f_mesh.exterior():
-        set = False
-        for num in number_list:
-            if not set and all(point_in_subdomain(v.point()) == num for v in vertices(f_mesh)):
-                facet_function[f_mesh] = num
-                set = True
-        if not set:
-            facet_function[f_mesh] = 1   # wall
+facet_function.array()[:] = markers
 
 f_mesh = HDF5File(mpi_comm_world(), 'meshes/' + meshName + '.hdf5', 'w')
 f_mesh.write(mesh, 'mesh')
@@ -0,0 +1,115 @@
+from __future__ import print_function
+import csv
+import numpy as np
+from scipy.sparse import csr_matrix
+from dolfin import Point
+from dolfin.cpp.common import MPI, mpi_comm_world, info
+from dolfin.cpp.la import Vector
+from dolfin.cpp.mesh import Cell
+
+# Velocity and pressure sampled in given points in every time step (lightweight alternative to full XDMF output)
+#   points are given by GeneralProblem options --probes, --probeline and --probeplanes
+#   owning cells and basis function values are found once, sampling is one sparse product per step
+#   point in more partitions (on partition boundary) is evaluated by the process with lowest rank, points outside mesh
+#   are skipped
+#   process 0 appends rows of float64 values (t, then u_x, u_y, u_z, p for every point) to [name].bin and saves point
+#   coordinates to [name]_points.csv, time series is read by:
+#       np.fromfile('[name].bin').reshape((-1, 1 + 4*len(points)))
+
+
+def line_points(start, end, count):
+    """count points on line segment from start to end"""
+    return [list(np.array(start) + (np.array(end) - np.array(start))*s) for s in np.linspace(0, 1, count)]
+
+
+def plane_points(mesh, z, grid):
+    """grid x grid points on plane z = const over bounding box of mesh"""
+    comm = mpi_comm_world()
+    coordinates = mesh.coordinates()
+    x = np.linspace(MPI.min(comm, coordinates[:, 0].min()), MPI.max(comm, coordinates[:, 0].max()), grid)
+    y = np.linspace(MPI.min(comm, coordinates[:, 1].min()), MPI.max(comm, coordinates[:, 1].max()), grid)
+    return [[i, j, z] for i in x for j in y]
+
+
+class Probes(object):
+    def __init__(self, points, V, Q, file_name):
+        comm = mpi_comm_world()
+        self.rank = MPI.rank(comm)
+        self.size = MPI.size(comm)
+        self.comm = comm.tompi4py() if self.size > 1 else None
+        self.file_name = file_name
+        mesh = V.mesh()
+        self.dim = mesh.geometry().dim()
+        points = np.array(points, dtype=float)
+
+        # owning cells (process with lowest rank owns points on partition boundaries)
+        tree = mesh.bounding_box_tree()
+        cells = np.array([tree.compute_first_entity_collision(Point(*x)) for x in points])
+        owner = np.where(cells < mesh.num_cells(), self.rank, self.size).astype(np.intc)
+        if self.comm is not None:
+            from mpi4py import MPI as MPI4
+            local_owner = owner.copy()
+            self.comm.Allreduce(local_owner, owner, op=MPI4.MIN)
+        if (owner == self.size).any():
+            info('Probes: %d points outside mesh are skipped' % (owner == self.size).sum())
+        inside = owner < self.size
+        self.points = points[inside]
+        mine = owner[inside] == self.rank
+        self.indices = np.where(mine)[0]  # positions of own points in list of all points
+        if self.comm is not None:
+            self.all_indices = self.comm.gather(self.indices, root=0)
+        self.u_matrix, self.u_dofs = self.sampling_matrix(V, self.points[mine], cells[inside][mine])
+        self.p_matrix, self.p_dofs = self.sampling_matrix(Q, self.points[mine], cells[inside][mine])
+        info('Probes: %d points' % len(self.points))
+
+        if self.rank == 0:
+            with open(file_name + '_points.csv', 'w') as point_file:
+                csvwriter = csv.writer(point_file, delimiter=';', escapechar='\\', quoting=csv.QUOTE_NONE)
+                csvwriter.writerow(['x', 'y', 'z'])
+                csvwriter.writerows(self.points)
+            open(file_name + '.bin', 'wb').close()
+
+    @staticmethod
+    def sampling_matrix(space, points, cells):
+        """returns sparse matrix S and global dofs d, so that S*u[d] are values of u (all components) in points"""
+        element = space.element()
+        dofmap = space.dofmap()
+        local_to_global = dofmap.tabulate_local_to_global_dofs()
+        value_size = element.value_dimension(0) if element.value_rank() else 1
+        rows, columns, values = [], [], []
+        for (i, (x, c)) in enumerate(zip(points, cells)):
+            cell = Cell(space.mesh(), int(c))
+            basis = np.zeros(element.space_dimension()*value_size)
+            element.evaluate_basis_all(basis, x, cell.get_vertex_coordinates(), cell.orientation())
+            basis = basis.reshape((-1, value_size))
+            dofs = local_to_global[dofmap.cell_dofs(int(c))]
+            for component in range(value_size):
+                rows.extend([i*value_size + component]*len(dofs))
+                columns.extend(dofs)
+                values.extend(basis[:, component])
+        dofs, columns = np.unique(np.array(columns, dtype=np.intc), return_inverse=True)
+        matrix = csr_matrix((values, (rows, columns)), shape=(len(points)*value_size, len(dofs)))
+        return matrix, dofs.astype(np.intc)
+
+    @staticmethod
+    def evaluate(function, matrix, dofs):
+        # gather is collective, it is called by all processes (even without own points)
+        values = Vector()
+        function.vector().gather(values, dofs)
+        return matrix.dot(values.array())
+
+    def sample(self, t, velocity, pressure):
+        """evaluates velocity and pressure (Functions on V and Q) in probe points and appends them to binary file"""
+        local = np.hstack((self.evaluate(velocity, self.u_matrix, self.u_dofs).reshape((-1, self.dim)),
+                           self.evaluate(pressure, self.p_matrix, self.p_dofs).reshape((-1, 1))))
+        if self.comm is not None:
+            gathered = self.comm.gather(local, root=0)
+            if self.rank != 0:
+                return
+            values = np.zeros((len(self.points), self.dim + 1))
+            for (indices, part) in zip(self.all_indices, gathered):
+                values[indices] = part
+        else:
+            values = local
+        with open(self.file_name + '.bin', 'ab') as data_file:
+            np.hstack(([t], values.flatten())).tofile(data_file)
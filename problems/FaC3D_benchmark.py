@@ -28,18 +28,17 @@ class Problem(gp.GeneralProblem):
 
         self.nu = 0.001 * args.nu  # kinematic viscosity
 
-        # Import gmsh mesh
+        # Import gmsh mesh (hdf5 if converted by mesh_convert.py)
         self.compatible_meshes = ['bench3D_1', 'bench3D_2', 'bench3D_3']
         if args.mesh not in self.compatible_meshes:
             exit('Bad mesh, should be some from %s' % str(self.compatible_meshes))
 
-        self.mesh = Mesh("meshes/" + args.mesh + ".xml")
-        self.cell_function = MeshFunction("size_t", self.mesh, "meshes/" + args.mesh + "_physical_region.xml")
-        self.facet_function = MeshFunction("size_t", self.mesh, "meshes/" + args.mesh + "_facet_region.xml")
+        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh, self.build_cache)
         self.dsIn = Measure("ds", subdomain_id=2, subdomain_data=self.facet_function)
         # self.dsOut = Measure("ds", subdomain_id=3, subdomain_data=self.facet_function)
         self.dsWall = Measure("ds", subdomain_id=1, subdomain_data=self.facet_function)
         self.dsCyl = Measure("ds", subdomain_id=5, subdomain_data=self.facet_function)
+        self.wall_markers = [1, 5]
         self.normal = FacetNormal(self.mesh)
         print("Mesh name: ", args.mesh, "    ", self.mesh)
         print("Mesh norm max: ", self.mesh.hmax())
@@ -1,14 +1,22 @@
 from __future__ import print_function
 import os, sys, traceback
 import csv, cPickle
+import numpy as np
 from dolfin import Function, assemble, interpolate, Expression, project, norm, errornorm, TensorFunctionSpace, plot, \
-    FunctionSpace, VectorFunctionSpace
+    FunctionSpace, VectorFunctionSpace, TrialFunction, TestFunction, vertex_to_dof_map
 from dolfin.cpp.common import mpi_comm_world, toc, MPI, info
+from dolfin.cpp.function import FunctionAssigner
 from dolfin.cpp.io import XDMFFile, HDF5File
-from dolfin.cpp.mesh import Mesh, MeshFunction, SubMesh, BoundaryMesh
+from dolfin.cpp.la import Vector
+from dolfin.cpp.mesh import Mesh, MeshFunction, SubMesh, BoundaryMesh, Facet, Cell
 from ufl import dx, div, inner, grad, sym, transpose, sqrt as sqrt_ufl, Identity, FacetNormal, dot
 from math import sqrt, pi, cos
 
+from build_cache import BuildCache
+from compressed_output import VertexMesh, CompressedFile
+from probes import Probes, line_points, plane_points
+from quadrature import limit_degree
+
 
 class GeneralProblem(object):
     def __init__(self, args, tc, metadata):
@@ -24,12 +32,16 @@ class GeneralProblem(object):
 
         self.args = args
         self.tc = tc
+        self.quadrature_cap = args.qcap  # option of GeneralSolver, same policy is used for solver forms
         self.tc.init_watch('saveP', 'Saved pressure', True)
         self.tc.init_watch('saveVel', 'Saved velocity', True)
         self.tc.init_watch('averageP', 'Averaged pressure', True)
         self.tc.init_watch('updateBC', 'Updated velocity BC', True)
         self.tc.init_watch('div', 'Computed and saved divergence', True)
         self.tc.init_watch('divNorm', 'Computed norm of divergence', True)
+        self.tc.init_watch('wss', 'Computed and saved wall shear stress', True)
+        self.tc.init_watch('averages', 'Accumulated and saved time averages', True)
+        self.tc.init_watch('probes', 'Sampled and saved probes', True)
 
         # If it is sensible (and implemented) to force pressure gradient on outflow boundary
         # 1. set self.outflow_area in initialize
@@ -39,6 +51,7 @@ class GeneralProblem(object):
         self.normal = None
         self.mesh = None
         self.facet_function = None
+        self.wall_markers = [1]  # facet_function values of no-slip walls (used by WSS computation)
         self.mesh_volume = None
         self.outflow_measures = []
 
@@ -51,6 +64,7 @@ class GeneralProblem(object):
 
         self.stepsInSecond = None
         self.volume = None
+        self.div_matrix = None
         self.vSpace = None
         self.vFunction = None
         self.divSpace = None
@@ -64,6 +78,8 @@ class GeneralProblem(object):
         self.step_number = 0
         self.save_this_step = False
         self.isWholeSecond = None
+        self.assigners = None  # used by separate_functions()
+        self.probes = None
         self.N1 = None
         self.N0 = None
 
@@ -94,10 +110,18 @@ class GeneralProblem(object):
         self.fileDictLDSG = {'ldsg': {'name': 'ldsg'},
                              'ldsg2': {'name': 'ldsg_tent'}}
         self.fileDictWSS = {'wss': {'name': 'wss'}, }
+        self.fileDictAverages = {'avg_u': {'name': 'velocity_mean'},
+                                 'avg_p': {'name': 'pressure_mean'},
+                                 'tawss': {'name': 'tawss'},
+                                 'osi': {'name': 'osi'}}
 
         # lists of functionals and other scalar output data
         self.time_list = []  # list of times, when error is  measured (used in report)
         self.second_list = []
+        # error control schedule (see is_ec_step()), errors, norms and divergences are computed only in sampled steps
+        #   ec_steps: numbers of sampled steps (lists of sampled quantities correspond to the end of this list)
+        self.ec_steps = []
+        self.ec_this_step = True
         self.listDict = {}  # list of fuctionals
         # dictionary of data lists {list, name, abbreviation, add scaled row to report}
         # normalisation coefficients (time-independent) are added to some lists to be used in normalized data series
@@ -106,6 +130,7 @@ class GeneralProblem(object):
         # norm lists (time-dependent normalisation coefficients) are added to some lists to be used in relative data
         #  series (to remove natural pulsation of error due to change in volume flow rate)
         # slist - lists for cycle-averaged values
+        # steps - numbers of steps of values in list, for lists not sampled in every ec step (see append_sample())
         # L2(0) means L2 difference of pressures taken with zero average
         self.listDict = {
             'd': {'list': [], 'name': 'corrected velocity L2 divergence', 'abrev': 'DC', 'scale': self.scale_factor, 'slist': []},
@@ -185,6 +210,16 @@ class GeneralProblem(object):
                 info("Error control in testing mode")
             else:
                 info("Error control on")
+        self.ec_schedule = args.ecschedule
+        self.ec_nth = args.ecnth
+        if self.ec_nth < 1:
+            exit('--ecnth should be positive')
+        self.ec_window = args.ecwindow
+        if self.ec_schedule != 'every':
+            info("Error control schedule: %s (n = %d)" % (self.ec_schedule, self.ec_nth))
+
+        # on-disk cache of partitioned mesh and constant matrices (see build_cache.py)
+        self.build_cache = BuildCache(args) if args.cache else None
 
         self.str_dir_name = "%s_%s_results" % (self.problem_code, metadata['name'])
         self.metadata['dir'] = self.str_dir_name
@@ -195,24 +230,66 @@ class GeneralProblem(object):
     @staticmethod
     def setup_parser_options(parser):
         parser.add_argument('-e', '--error', help='Error control mode', choices=['doEC', 'noEC', 'test'], default='doEC')
+        parser.add_argument('--ecschedule', help='Steps in which errors and divergence are computed',
+                            choices=['every', 'nth', 'last', 'systole'], default='every')
+        #   every: every time step
+        #   nth: every n-th step (see --ecnth)
+        #   last: every step in last cycle
+        #   systole: every step in part of cycle given by --ecwindow, every n-th step elsewhere
+        #   last step of every second is always sampled (values averaged over seconds are computed there)
+        parser.add_argument('--ecnth', help='compute errors in every n-th step (for --ecschedule nth/systole)', type=int,
+                            default=10)
+        parser.add_argument('--ecwindow', help='part of cycle (start end) sampled in every step (--ecschedule systole)',
+                            type=float, nargs=2, default=[0.0, 0.4])
         parser.add_argument('-S', '--save', help='Save solution mode', choices=['doSave', 'noSave', 'diff', 'only_vel'],
                             default='noSave')
         parser.add_argument('--savespace', help='save only n-th step in first cycle', type=int, default=1)
         #   doSave: create .xdmf files with velocity, pressure, divergence
         #   diff: save also difference vel-sol
         #   noSave: do not create .xdmf files with velocity, pressure, divergence
+        parser.add_argument('--output', help='format of saved fields', choices=['xdmf', 'hdf5'], default='xdmf')
+        #   xdmf: dolfin XDMFFile (float64)
+        #   hdf5: float32 vertex values in compressed HDF5 with XDMF index (see compressed_output.py, needs h5py)
+        parser.add_argument('--quantize', help='keep only n mantissa bits of saved values (--output hdf5, 0 for all)',
+                            type=int, default=0)
         parser.add_argument('--nu', help='kinematic viscosity factor', type=float, default=1.0)
         parser.add_argument('--onset', help='boundary condition onset length', type=float, default=0.0)
         parser.add_argument('--ldsg', help='save laplace(u) - div(2sym(grad(u))) difference', action='store_true')
         parser.add_argument('--wss', help='compute wall shrear stress', action='store_true')
+        parser.add_argument('--averages', help='save mean velocity, pressure, TAWSS and OSI of every cycle',
+                            action='store_true')
+        #   averages are accumulated in every step and saved at the end of every second (can be used with -S noSave)
+        parser.add_argument('--probes', help='sample velocity and pressure in points x1 y1 z1 x2 y2 z2 ...', type=float,
+                            nargs='+', default=[])
+        parser.add_argument('--probeline', help='sample velocity and pressure in n points on line x0 y0 z0 x1 y1 z1 n',
+                            type=float, nargs=7)
+        parser.add_argument('--probeplanes', help='sample velocity and pressure on planes z = z1, z2, ...', type=float,
+                            nargs='+', default=[])
+        parser.add_argument('--probegrid', help='planes are sampled in n x n points (--probeplanes)', type=int,
+                            default=20)
+        #   probes are saved in every step to binary file (see probes.py)
+        parser.add_argument('--cache', help='load partitioned mesh and constant matrices from cache (or create it)',
+                            action='store_true')
 
     @staticmethod
-    def loadMesh(mesh):
-        f = HDF5File(mpi_comm_world(), 'meshes/'+mesh+'.hdf5', 'r')
-        mesh = Mesh()
-        f.read(mesh, 'mesh', False)
-        facet_function = MeshFunction("size_t", mesh)
-        f.read(facet_function, 'facet_function')
+    def loadMesh(mesh, cache=None):
+        if cache is not None and cache.has_mesh():
+            return cache.load_mesh()
+        # prefer hdf5 (read and distributed in parallel), xml is read serially (convert using mesh_convert.py)
+        if os.path.exists('meshes/'+mesh+'.hdf5'):
+            f = HDF5File(mpi_comm_world(), 'meshes/'+mesh+'.hdf5', 'r')
+            mesh = Mesh()
+            f.read(mesh, 'mesh', False)
+            facet_function = MeshFunction("size_t", mesh)
+            f.read(facet_function, 'facet_function')
+            f.close()
+        else:
+            info('Mesh %s not converted to hdf5, loading xml (run mesh_convert.py to speed up loading).' % mesh)
+            facet_file = 'meshes/' + mesh + '_facet_region.xml'
+            mesh = Mesh('meshes/' + mesh + '.xml')
+            facet_function = MeshFunction("size_t", mesh, facet_file)
+        if cache is not None:
+            cache.save_mesh(mesh, facet_function)
         return mesh, facet_function
 
     def initialize(self, V, Q, PS, D):
@@ -224,8 +301,15 @@ class GeneralProblem(object):
         self.divFunction = Function(D)
         self.pFunction = Function(Q)
         self.volume = assemble(interpolate(Expression("1.0"), Q) * dx)
-
-        if self.doSave:
+        # u^T K u = ||div u||^2, used in compute_div() instead of assembling norm every step
+        self.div_matrix = assemble(div(TrialFunction(V)) * div(TestFunction(V)) * dx)
+        if self.args.wss or self.args.averages:
+            self.prepare_wss(V, Q)
+        if self.args.averages:
+            self.prepare_averages(V, Q)
+        self.prepare_probes(V, Q)
+
+        if self.doSave or self.args.averages:
             # self.pgSpace = VectorFunctionSpace(mesh, "DG", 0)
             # self.pgFunction = Function(self.pgSpace)
             self.initialize_xdmf_files()
@@ -238,64 +322,97 @@ class GeneralProblem(object):
         self.metadata['filename_base'] = self.problem_code + '_' + self.metadata['name']
 
         # assemble file dictionary
+        if not self.doSave:
+            self.fileDict = {}  # only averaged fields are saved
         if self.doSaveDiff:
             self.fileDict.update(self.fileDictDiff)
-        if self.metadata['hasTentativeV']:
+        if self.metadata['hasTentativeV'] and self.doSave:
             self.fileDict.update(self.fileDictTent)
             if self.doSaveDiff:
                 self.fileDict.update(self.fileDictTentDiff)
-        if self.metadata['hasTentativeP']:
+        if self.metadata['hasTentativeP'] and self.doSave:
             self.fileDict.update(self.fileDictTentP)
             if self.doSaveDiff:
                 self.fileDict.update(self.fileDictTentPDiff)
-        if self.args.ldsg:
+        if self.args.ldsg and self.doSave:
             self.fileDict.update(self.fileDictLDSG)
-        if self.args.wss:
+        if self.args.wss and self.doSave:
             self.fileDict.update(self.fileDictWSS)
+        if self.args.averages:
+            self.fileDict.update(self.fileDictAverages)
         # create files
+        if self.args.output == 'hdf5':
+            info('  Saving compressed float32 vertex values (quantized to %d bits).' % self.args.quantize
+                 if self.args.quantize else '  Saving compressed float32 vertex values.')
+            vertex_meshes = {}  # one for every mesh, WSS fields are saved on boundary mesh
         for key, value in self.fileDict.iteritems():
-            value['file'] = XDMFFile(mpi_comm_world(), self.str_dir_name + "/" + self.problem_code + '_' +
-                                     self.metadata['name'] + value['name'] + ".xdmf")
+            if self.args.output == 'hdf5':
+                mesh = self.wall_mesh if key in ['wss', 'tawss', 'osi'] else self.mesh
+                if mesh.id() not in vertex_meshes:
+                    vertex_meshes[mesh.id()] = VertexMesh(mesh)  # collective
+                value['file'] = CompressedFile(vertex_meshes[mesh.id()], self.str_dir_name + "/" + self.problem_code +
+                                               '_' + self.metadata['name'] + value['name'], self.args.quantize)
+            else:
+                value['file'] = XDMFFile(mpi_comm_world(), self.str_dir_name + "/" + self.problem_code + '_' +
+                                         self.metadata['name'] + value['name'] + ".xdmf")
             value['file'].parameters['rewrite_function_mesh'] = False  # saves lots of space (for use with static mesh)
+            # name of vector shown in ParaView (otherwise FEniCS uses generic name "f_[number]")
+            value['vector_name'] = self.metadata['name'] + value['name']
+
+    def write_xdmf(self, key, field):
+        """writes field into file from fileDict[key], renamed so no postprocessing of .xdmf files is needed"""
+        value = self.fileDict[key]
+        field.rename(value['vector_name'], value['vector_name'])
+        value['file'] << field
+
+    def close_files(self):
+        """closes compressed output files (XDMFFiles are closed when destroyed)"""
+        for value in self.fileDict.itervalues():
+            if isinstance(value.get('file'), CompressedFile):
+                value['file'].close()
 
     # method for saving divergence (ensuring, that it will be one time line in ParaView)
     def save_div(self, is_tent, field):
         self.tc.start('div')
         self.divFunction.assign(project(div(field), self.divSpace))
-        self.fileDict['d2' if is_tent else 'd']['file'] << self.divFunction
+        self.write_xdmf('d2' if is_tent else 'd', self.divFunction)
         self.tc.end('div')
 
     def compute_div(self, is_tent, velocity):
+        if not self.ec_this_step:
+            return
         self.tc.start('divNorm')
         div_list = self.listDict['d2' if is_tent else 'd']['list']
-        div_list.append(norm(velocity, 'Hdiv0'))
+        if velocity.vector().size() == self.vSpace.dim():
+            x = velocity.vector()
+            div_list.append(sqrt(max(x.inner(self.div_matrix * x), 0.0)))
+        else:  # e. g. velocity as subfunction of mixed space
+            div_list.append(norm(velocity, 'Hdiv0'))
         if self.isWholeSecond:
-            self.listDict['d2' if is_tent else 'd']['slist'].append(
-                sum([i*i for i in div_list[self.N0:self.N1]])/self.stepsInSecond)
+            self.listDict['d2' if is_tent else 'd']['slist'].append(self.second_average(div_list)**2)
         self.tc.end('divNorm')
 
     # method for saving velocity (ensuring, that it will be one time line in ParaView)
     def save_vel(self, is_tent, field, t):
         self.vFunction.assign(field)
-        self.fileDict['u2' if is_tent else 'u']['file'] << self.vFunction
+        self.write_xdmf('u2' if is_tent else 'u', self.vFunction)
         if self.doSaveDiff:
             self.vFunction.assign((1.0 / self.vel_normalization_factor[0]) * (field - self.solution))
-            self.fileDict['u2D' if is_tent else 'uD']['file'] << self.vFunction
+            self.write_xdmf('u2D' if is_tent else 'uD', self.vFunction)
         if self.args.ldsg:
             # info(div(2.*sym(grad(field))-grad(field)).ufl_shape)
             form = div(2.*sym(grad(field))-grad(field))
             self.pFunction.assign(project(sqrt_ufl(inner(form, form)), self.pSpace))
-            self.fileDict['ldsg2' if is_tent else 'ldsg']['file'] << self.pFunction
+            self.write_xdmf('ldsg2' if is_tent else 'ldsg', self.pFunction)
             # self.vFunction.assign(project(div(2.*sym(grad(field))-grad(field)), self.vSpace))
             # self.fileDict['ldsg2' if is_tent else 'ldsg']['file'] << self.vFunction
 
     def compute_err(self, is_tent, velocity, t):
-        if self.doErrControl and self.has_analytic_solution:
+        if self.doErrControl and self.has_analytic_solution and self.ec_this_step:
             er_list_L2 = self.listDict['u2L2' if is_tent else 'u_L2']['list']
             er_list_H1 = self.listDict['u2H1' if is_tent else 'u_H1']['list']
             self.tc.start('errorV')
-            errorL2_sq = assemble(inner(velocity - self.solution, velocity - self.solution) * dx)  # faster than errornorm
-            errorH1seminorm_sq = assemble(inner(grad(velocity - self.solution), grad(velocity - self.solution)) * dx)  # faster than errornorm
+            errorL2_sq, errorH1seminorm_sq = self.velocity_error_sq(velocity)
             info('  H1 seminorm error: %f' % sqrt(errorH1seminorm_sq))
             errorL2 = sqrt(errorL2_sq)
             errorH1 = sqrt(errorL2_sq + errorH1seminorm_sq)
@@ -314,14 +431,22 @@ class GeneralProblem(object):
                 er_list_test_H1.append(errornorm(velocity, self.solution, norm_type='H1', degree_rise=0))
                 self.tc.end('errorVtest')
             if self.isWholeSecond:
-                self.listDict['u2L2' if is_tent else 'u_L2']['slist'].append(
-                    sqrt(sum([i*i for i in er_list_L2[self.N0:self.N1]])/self.stepsInSecond))
-                self.listDict['u2H1' if is_tent else 'u_H1']['slist'].append(
-                    sqrt(sum([i*i for i in er_list_H1[self.N0:self.N1]])/self.stepsInSecond))
+                self.listDict['u2L2' if is_tent else 'u_L2']['slist'].append(self.second_average(er_list_L2))
+                self.listDict['u2H1' if is_tent else 'u_H1']['slist'].append(self.second_average(er_list_H1))
             # stopping criteria
             if self.last_error > self.divergence_treshold:
                 raise RuntimeError('STOPPED: Failed divergence test!')
 
+    def assemble_form(self, form):
+        """assembles form with quadrature degree of integrals limited by --qcap (see quadrature.py)"""
+        return assemble(limit_degree(form, self.quadrature_cap))
+
+    def velocity_error_sq(self, velocity):
+        """returns squared L2 norm and squared H1 seminorm of difference between velocity and analytic solution"""
+        errorL2_sq = self.assemble_form(inner(velocity - self.solution, velocity - self.solution) * dx)  # faster than errornorm
+        errorH1seminorm_sq = self.assemble_form(inner(grad(velocity - self.solution), grad(velocity - self.solution)) * dx)  # faster than errornorm
+        return errorL2_sq, errorH1seminorm_sq
+
     def averaging_pressure(self, pressure):
         self.tc.start('averageP')
         # averaging pressure (substract average)
@@ -334,7 +459,7 @@ class GeneralProblem(object):
 
     def save_pressure(self, is_tent, pressure):
         self.tc.start('saveP')
-        self.fileDict['p2' if is_tent else 'p']['file'] << pressure
+        self.write_xdmf('p2' if is_tent else 'p', pressure)
         # pg = project((1.0 / self.pg_normalization_factor[0]) * grad(pressure), self.pgSpace)  # NT normalisation factor defined only in Womersley
         # self.pgFunction.assign(pg)
         # self.fileDict['pg2' if is_tent else 'pg'][0] << self.pgFunction
@@ -360,6 +485,9 @@ class GeneralProblem(object):
         self.actual_time = actual_time
         self.step_number = step_number
         self.time_list.append(self.actual_time)
+        self.ec_this_step = self.is_ec_step(actual_time, step_number)
+        if self.ec_this_step:
+            self.ec_steps.append(step_number)
         if self.onset < 0.001 or self.actual_time > self.onset:
             self.onset_factor = 1.
         else:
@@ -373,35 +501,191 @@ class GeneralProblem(object):
             else:
                 self.save_this_step = False
 
+    def is_ec_step(self, actual_time, step_number):
+        """decides if errors, norms and divergences are computed in this step (according to --ecschedule)"""
+        if self.ec_schedule == 'every' or step_number % self.stepsInSecond == 0:
+            return True
+        if self.ec_schedule == 'last':
+            return actual_time > self.metadata['time'] - 1.0 + self.metadata['dt']/2.
+        if self.ec_schedule == 'systole' and self.ec_window[0] <= actual_time % 1.0 <= self.ec_window[1]:
+            return True
+        return step_number % self.ec_nth == 0
+
+    def append_sample(self, key, value):
+        """appends value to listDict[key] with number of this step (for lists sampled only in some ec steps)"""
+        self.listDict[key]['list'].append(value)
+        self.listDict[key].setdefault('steps', []).append(self.step_number)
+
+    def second_average(self, values, second=None, steps=None):
+        """Root mean square of values over given second (default: second ending in this step).
+        Values are sampled in steps (default: last len(values) steps of ec_steps), each sample is weighted by number
+        of time steps since previous sample (single sample in last step of second has weight stepsInSecond).
+        Returns nan if there is no sample in that second."""
+        n1 = self.N1 if second is None else second*self.stepsInSecond
+        n0 = n1 - self.stepsInSecond
+        all_steps = self.ec_steps if steps is None else steps
+        steps = all_steps[-len(values):] if values else []
+        previous = ([0] + all_steps)[-len(values)-1:-1] if values else []
+        samples = [(step - max(prev, n0), v) for (step, prev, v) in zip(steps, previous, values) if n0 < step <= n1]
+        if not samples:
+            return float('nan')
+        return sqrt(sum([w*v*v for (w, v) in samples])/self.stepsInSecond)
+
+    def timeline(self, values, steps=None):
+        """values of sampled quantity for all time steps in time_list (nan in steps without sample), values are sampled
+        in steps (default: ec_steps)"""
+        steps = self.ec_steps if steps is None else steps
+        if len(values) == len(self.time_list) or len(values) != len(steps):
+            return values
+        timeline = [float('nan')] * len(self.time_list)
+        for (step, v) in zip(steps, values):
+            timeline[step - 1] = v
+        return timeline
+
+    def prepare_wss(self, V, Q):
+        """builds boundary mesh, spaces and operators used by compute_wss():
+            stress (P1 tensor) = M^-1 (B_u u + B_p p), where M is lumped mass matrix (nodal averaging)
+            values in boundary vertices are gathered from volume dofs, vertex normals are averaged normals of wall
+            facets (marked by self.wall_markers), WSS is zero in boundary vertices not lying on wall"""
+        info('Preparing WSS computation')
+        dim = self.mesh.geometry().dim()
+        T = TensorFunctionSpace(self.mesh, 'Lagrange', 1)
+        tau = TestFunction(T)
+        self.wss_B_u = assemble(inner(2*sym(grad(TrialFunction(V))), tau) * dx)
+        self.wss_B_p = assemble(inner(-TrialFunction(Q)*Identity(dim), tau) * dx)
+        ones = Function(T)
+        ones.vector()[:] = 1.0
+        self.wss_inverse_mass = 1.0/(assemble(inner(TrialFunction(T), tau) * dx)*ones.vector()).array()
+
+        self.wall_mesh = BoundaryMesh(self.mesh, 'exterior')
+        self.wss_function = Function(VectorFunctionSpace(self.wall_mesh, 'Lagrange', 1))
+        vertex_map = self.wall_mesh.entity_map(0).array()
+        # vertex_to_dof_map lists dofs of all components of vertex consecutively
+        local_dofs = vertex_to_dof_map(T).reshape((-1, dim*dim))[vertex_map]
+        self.wss_stress_dofs = T.dofmap().tabulate_local_to_global_dofs()[local_dofs].flatten().astype(np.intc)
+        boundary_dofs = vertex_to_dof_map(self.wss_function.function_space()).reshape((-1, dim))
+        self.wss_owned = boundary_dofs[:, 0] < self.wss_function.vector().local_size()
+        self.wss_boundary_dofs = boundary_dofs[self.wss_owned]
+
+        facet_map = self.wall_mesh.entity_map(dim - 1).array()
+        normals = np.zeros((self.wall_mesh.num_vertices(), dim))
+        for (index, (vertices, facet)) in enumerate(zip(self.wall_mesh.cells(), facet_map)):
+            if self.facet_function[int(facet)] not in self.wall_markers:  # inflow/outflow facet
+                continue
+            normal = Facet(self.mesh, int(facet)).normal()  # outward normal of exterior facet
+            normals[vertices] += Cell(self.wall_mesh, index).volume()*np.array([normal[i] for i in range(dim)])
+        self.wss_on_wall = (normals != 0.0).any(axis=1)
+        normals[self.wss_on_wall] /= np.sqrt((normals[self.wss_on_wall]**2).sum(axis=1))[:, np.newaxis]
+        self.wss_normals = normals  # zero in vertices not lying on wall
+        self.wss_values = None
+
+    def prepare_probes(self, V, Q):
+        """creates Probes in points given by --probes, --probeline and --probeplanes (if any)"""
+        points = [self.args.probes[i:i+3] for i in range(0, len(self.args.probes) - 2, 3)]
+        if self.args.probeline:
+            points += line_points(self.args.probeline[0:3], self.args.probeline[3:6], int(self.args.probeline[6]))
+        for z in self.args.probeplanes:
+            points += plane_points(self.mesh, z, self.args.probegrid)
+        if points:
+            self.probes = Probes(points, V, Q, self.str_dir_name + '/' + self.problem_code + '_' +
+                                 self.metadata['name'] + 'probes')
+
+    def separate_functions(self, velocity, pressure):
+        """returns velocity and pressure as Functions on V and Q (assigns subfunctions of mixed space, direct solver)"""
+        if velocity.vector().size() == self.vSpace.dim():
+            return velocity, pressure
+        if self.assigners is None:
+            self.assigners = (FunctionAssigner(self.vSpace, velocity.function_space()),
+                              FunctionAssigner(self.pSpace, pressure.function_space()))
+        self.assigners[0].assign(self.vFunction, velocity)
+        self.assigners[1].assign(self.pFunction, pressure)
+        return self.vFunction, self.pFunction
+
+    def prepare_averages(self, V, Q):
+        """creates accumulators of time averages over one cycle (second):
+            mean velocity and pressure (Functions on V, Q)
+            TAWSS = mean |wss|, OSI = (1 - |mean wss|/mean |wss|)/2 (in boundary vertices, see compute_wss())"""
+        self.average_count = 0
+        self.average_v = Function(V)
+        self.average_p = Function(Q)
+        self.wss_sum = np.zeros((self.wall_mesh.num_vertices(), self.mesh.geometry().dim()))
+        self.wss_magnitude_sum = np.zeros(self.wall_mesh.num_vertices())
+        self.tawss = Function(FunctionSpace(self.wall_mesh, 'Lagrange', 1))
+        self.osi = Function(self.tawss.function_space())
+        dofs = vertex_to_dof_map(self.tawss.function_space())
+        self.average_owned = dofs < self.tawss.vector().local_size()
+        self.average_dofs = dofs[self.average_owned]
+
+    def accumulate_averages(self, velocity, pressure):
+        """adds values of this step, averages are saved and reset at the end of every second"""
+        self.tc.start('averages')
+        velocity, pressure = self.separate_functions(velocity, pressure)
+        self.average_v.vector().axpy(1.0, velocity.vector())
+        self.average_p.vector().axpy(1.0, pressure.vector())
+        if not (self.args.wss and self.save_this_step):  # otherwise already computed
+            self.compute_wss(velocity, pressure)
+        self.wss_sum += self.wss_values
+        self.wss_magnitude_sum += np.sqrt((self.wss_values*self.wss_values).sum(axis=1))
+        self.average_count += 1
+        if self.isWholeSecond:
+            info('Saving averages over last %d steps' % self.average_count)
+            for function in [self.average_v, self.average_p]:
+                vector = function.vector()
+                vector *= 1.0/self.average_count
+            self.write_xdmf('avg_u', self.average_v)
+            self.write_xdmf('avg_p', self.average_p)
+            magnitude_of_sum = np.sqrt((self.wss_sum*self.wss_sum).sum(axis=1))
+            ratio = np.ones_like(magnitude_of_sum)
+            nonzero = self.wss_magnitude_sum > 0.0
+            ratio[nonzero] = magnitude_of_sum[nonzero]/self.wss_magnitude_sum[nonzero]
+            tawss = self.wss_magnitude_sum/self.average_count
+            for (function, values) in [(self.tawss, tawss), (self.osi, 0.5*(1.0 - ratio))]:
+                local_values = np.zeros(function.vector().local_size())
+                local_values[self.average_dofs] = values[self.average_owned]
+                function.vector().set_local(local_values)
+                function.vector().apply('insert')
+            self.write_xdmf('tawss', self.tawss)
+            self.write_xdmf('osi', self.osi)
+            self.average_v.vector().zero()
+            self.average_p.vector().zero()
+            self.wss_sum[:] = 0.0
+            self.wss_magnitude_sum[:] = 0.0
+            self.average_count = 0
+        self.tc.end('averages')
+
+    def compute_wss(self, velocity, pressure):
+        """returns Function on boundary mesh with wall shear stress (tangential part of traction)"""
+        dim = self.mesh.geometry().dim()
+        velocity, pressure = self.separate_functions(velocity, pressure)
+        stress = self.wss_B_u*velocity.vector()
+        stress.axpy(1.0, self.wss_B_p*pressure.vector())
+        stress.set_local(stress.array()*self.wss_inverse_mass)
+        stress.apply('insert')
+        boundary_stress = Vector()
+        stress.gather(boundary_stress, self.wss_stress_dofs)
+        boundary_stress = boundary_stress.array().reshape((-1, dim, dim))
+        traction = (boundary_stress*self.wss_normals[:, np.newaxis, :]).sum(axis=2)
+        wss = traction - (traction*self.wss_normals).sum(axis=1)[:, np.newaxis]*self.wss_normals
+        wss[~self.wss_on_wall] = 0.0
+        self.wss_values = wss  # in all boundary vertices of this process, used by accumulate_averages()
+        values = np.zeros(self.wss_function.vector().local_size())
+        values[self.wss_boundary_dofs] = wss[self.wss_owned]
+        self.wss_function.vector().set_local(values)
+        self.wss_function.vector().apply('insert')
+        return self.wss_function
+
     def compute_functionals(self, velocity, pressure, t):
-        if self.args.wss:
-            info('Computing stress tensor')
-            I = Identity(velocity.geometric_dimension())
-            T = TensorFunctionSpace(self.mesh, 'Lagrange', 1)
-            stress = project(-pressure*I + 2*sym(grad(velocity)), T)
-            info('Generating boundary mesh')
-            wall_mesh = BoundaryMesh(self.mesh, 'exterior')
-            # wall_mesh = SubMesh(self.mesh, self.facet_function, 1)   # QQ why does not work?
-            # plot(wall_mesh, interactive=True)
-            info('  Boundary mesh geometric dim: %d' % wall_mesh.geometry().dim())
-            info('  Boundary mesh topologic dim: %d' % wall_mesh.topology().dim())
-            info('Projecting stress to boundary mesh')
-            Tb = TensorFunctionSpace(wall_mesh, 'Lagrange', 1)
-            stress_b = interpolate(stress, Tb)
-            self.fileDict['wss']['file'] << stress_b
-
-
-            if False:  # does not work
-                info('Computing WSS')
-                n = FacetNormal(wall_mesh)
-                info(stress_b, True)
-                # wss = stress_b*n - inner(stress_b*n, n)*n
-                wss = dot(stress_b, n) - inner(dot(stress_b, n), n)*n   # equivalent
-                Vb = VectorFunctionSpace(wall_mesh, 'Lagrange', 1)
-                Sb = FunctionSpace(wall_mesh, 'Lagrange', 1)
-                # wss_func = project(wss, Vb)
-                wss_norm = project(sqrt(inner(wss, wss)), Sb)
-                plot(wss_norm, interactive=True)
+        if self.args.wss and self.save_this_step:
+            self.tc.start('wss')
+            self.write_xdmf('wss', self.compute_wss(velocity, pressure))
+            self.tc.end('wss')
+        if self.args.averages:
+            self.accumulate_averages(velocity, pressure)
+        if self.probes is not None:
+            self.tc.start('probes')
+            velocity, pressure = self.separate_functions(velocity, pressure)
+            self.probes.sample(t, velocity, pressure)
+            self.tc.end('probes')
 
         # following was used to test laplace and stress formulation differences
         # dsgml = sqrt(assemble((1./self.mesh_volume)*inner(div(2*sym(grad(velocity))-grad(velocity)), div(2*sym(grad(velocity))-grad(velocity)))*dx))
@@ -442,14 +726,14 @@ class GeneralProblem(object):
                 l = self.listDict[key]
                 if l['list']:
                     abrev = l['abrev']
-                    report_writer.writerow([md['name'], l['name'], abrev] + l['list'])
+                    report_writer.writerow([md['name'], l['name'], abrev] + self.timeline(l['list'], l.get('steps')))
                     if 'scale' in l:
-                        temp_list = [i/l['scale'][0] for i in l['list']]
+                        temp_list = self.timeline([i/l['scale'][0] for i in l['list']], l.get('steps'))
                         report_writer.writerow([md['name'], "scaled " + l['name'], abrev+"s"] + temp_list +
                                                ['scale factor:' + str(l['scale'])])
                     if 'norm' in l:
                         if l['norm']:
-                            temp_list = [i/l['norm'][0] for i in l['list']]
+                            temp_list = self.timeline([i/l['norm'][0] for i in l['list']], l.get('steps'))
                             report_writer.writerow([md['name'], "normalized " + l['name'], abrev+"n"] + temp_list)
                         else:
                             info('Norm missing:' + str(l))
@@ -458,7 +742,8 @@ class GeneralProblem(object):
                         norm_list = self.listDict[l['relative']]['list']
                         temp_list = [l['list'][i]/norm_list[i] for i in range(0, len(l['list']))]
                         self.listDict[key]['relative_list'] = temp_list
-                        report_writer.writerow([md['name'], "relative " + l['name'], abrev+"r"] + temp_list)
+                        report_writer.writerow([md['name'], "relative " + l['name'], abrev+"r"] +
+                                               self.timeline(temp_list))
 
         # report error norm, norm of div, and pressure gradients averaged over seconds
         with open(self.str_dir_name + "/report_seconds.csv", 'w') as reportFile:
@@ -486,10 +771,7 @@ class GeneralProblem(object):
                         temp_list = []
                         # info('relative second list of'+ str(l['abrev']))
                         for sec in self.second_list:
-                            N0 = (sec-1)*self.stepsInSecond
-                            N1 = sec*self.stepsInSecond
-                            # info([sec,  N0, N1])
-                            temp_list.append(sqrt(sum([i*i for i in l['relative_list'][N0:N1]])/float(self.stepsInSecond)))
+                            temp_list.append(self.second_average(l['relative_list'], sec, l.get('steps')))
                         l['relative_list_sec'] = temp_list
                         report_writer.writerow([md['name'], "relative " + l['name'], abrev+"r"] + temp_list)
 
@@ -522,6 +804,7 @@ class GeneralProblem(object):
         with open(self.str_dir_name + "/report_timecontrol.csv", 'w') as reportFile:
             self.tc.report(reportFile, self.metadata['name'])
 
+        self.close_files()
         self.remove_status_file()
 
         # create file showing all was done well
@@ -535,6 +818,7 @@ class GeneralProblem(object):
         f = open(self.metadata['name'] + "_failed_at_%5.3f.report" % t, "w")
         f.write(traceback.format_exc())
         f.close()
+        self.close_files()
         self.remove_status_file()
 
     def write_status_file(self, t):
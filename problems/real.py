@@ -32,7 +32,7 @@ class Problem(gp.GeneralProblem):
         self.compatible_meshes = ['HYK']
         if args.mesh not in self.compatible_meshes:
             exit('Bad mesh, should be some from %s' % str(self.compatible_meshes))
-        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh)
+        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh, self.build_cache)
         info("Mesh name: " + args.mesh + "    " + str(self.mesh))
         f_ini = open('meshes/'+args.mesh+'.ini', 'r')
         reader = csv.reader(f_ini, delimiter=' ', escapechar='\\')
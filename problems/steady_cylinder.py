@@ -40,7 +40,7 @@ class Problem(gp.GeneralProblem):
         self.mesh_volume = pi*25.*20.
 
         # Import gmsh mesh
-        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh)
+        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh, self.build_cache)
         self.dsIn = Measure("ds", subdomain_id=2, subdomain_data=self.facet_function)
         self.dsOut = Measure("ds", subdomain_id=3, subdomain_data=self.facet_function)
         self.dsWall = Measure("ds", subdomain_id=1, subdomain_data=self.facet_function)
@@ -180,11 +180,13 @@ class Problem(gp.GeneralProblem):
             self.v_in.t = self.actual_time
         self.tc.end('updateBC')
 
+        if not self.ec_this_step:
+            return
         self.tc.start('analyticVnorms')
         self.analytic_v_norm_L2 = norm(self.solution, norm_type='L2')
         self.analytic_v_norm_H1 = norm(self.solution, norm_type='H1')
-        self.analytic_v_norm_H1w = sqrt(assemble((inner(grad(self.solution), grad(self.solution)) +
-                                                  inner(self.solution, self.solution)) * self.dsWall))
+        self.analytic_v_norm_H1w = sqrt(self.assemble_form((inner(grad(self.solution), grad(self.solution)) +
+                                                            inner(self.solution, self.solution)) * self.dsWall))
         self.listDict['av_norm_L2']['list'].append(self.analytic_v_norm_L2)
         self.listDict['av_norm_H1']['list'].append(self.analytic_v_norm_H1)
         self.listDict['av_norm_H1w']['list'].append(self.analytic_v_norm_H1w)
@@ -192,18 +194,20 @@ class Problem(gp.GeneralProblem):
 
     def compute_err(self, is_tent, velocity, t):
         super(Problem, self).compute_err(is_tent, velocity, t)
+        if not self.ec_this_step:
+            return
         er_list_H1w = self.listDict['u2H1w' if is_tent else 'u_H1w']['list']
-        errorH1wall = sqrt(assemble((inner(grad(velocity - self.solution), grad(velocity - self.solution)) +
-                                     inner(velocity - self.solution, velocity - self.solution)) * self.dsWall))
+        errorH1wall = sqrt(self.assemble_form((inner(grad(velocity - self.solution), grad(velocity - self.solution)) +
+                                               inner(velocity - self.solution, velocity - self.solution)) * self.dsWall))
         er_list_H1w.append(errorH1wall)
         print('  Relative H1wall error:', errorH1wall / self.analytic_v_norm_H1w)
         if self.isWholeSecond:
-            self.listDict['u2H1w' if is_tent else 'u_H1w']['slist'].append(
-                sqrt(sum([i*i for i in er_list_H1w[self.N0:self.N1]])/self.stepsInSecond))
+            self.listDict['u2H1w' if is_tent else 'u_H1w']['slist'].append(self.second_average(er_list_H1w))
 
     def compute_functionals(self, velocity, pressure, t):
         super(Problem, self).compute_functionals(velocity, pressure, t)
-        self.compute_force(velocity, pressure, t)
+        if self.ec_this_step:
+            self.compute_force(velocity, pressure, t)
 
     def compute_force(self, velocity, pressure, t):
         self.tc.start('errorForce')
@@ -211,23 +215,23 @@ class Problem(gp.GeneralProblem):
         def T(p, v):
             return -p * I + 2.0 * self.nu * sym(grad(v))
         error_force = sqrt(
-                assemble(inner((T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal,
-                               (T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal) * self.dsWall))
-        an_force = sqrt(assemble(inner(T(self.sol_p, self.solution) * self.normal,
-                                            T(self.sol_p, self.solution) * self.normal) * self.dsWall))
-        an_f_normal = sqrt(assemble(inner(inner(T(self.sol_p, self.solution) * self.normal, self.normal),
-                                               inner(T(self.sol_p, self.solution) * self.normal, self.normal)) * self.dsWall))
+                self.assemble_form(inner((T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal,
+                                         (T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal) * self.dsWall))
+        an_force = sqrt(self.assemble_form(inner(T(self.sol_p, self.solution) * self.normal,
+                                                      T(self.sol_p, self.solution) * self.normal) * self.dsWall))
+        an_f_normal = sqrt(self.assemble_form(inner(inner(T(self.sol_p, self.solution) * self.normal, self.normal),
+                                                         inner(T(self.sol_p, self.solution) * self.normal, self.normal)) * self.dsWall))
         error_f_normal = sqrt(
-                assemble(inner(inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal),
-                               inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal)) * self.dsWall))
+                self.assemble_form(inner(inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal),
+                                         inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal)) * self.dsWall))
         an_f_shear = sqrt(
-                assemble(inner((I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal,
-                               (I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal) * self.dsWall))
+                self.assemble_form(inner((I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal,
+                                         (I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal) * self.dsWall))
         error_f_shear = sqrt(
-                assemble(inner((I - outer(self.normal, self.normal)) *
-                               (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal,
-                               (I - outer(self.normal, self.normal)) *
-                               (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal) * self.dsWall))
+                self.assemble_form(inner((I - outer(self.normal, self.normal)) *
+                                         (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal,
+                                         (I - outer(self.normal, self.normal)) *
+                                         (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal) * self.dsWall))
         self.listDict['a_force_wall']['list'].append(an_force)
         self.listDict['a_force_wall_normal']['list'].append(an_f_normal)
         self.listDict['a_force_wall_shear']['list'].append(an_f_shear)
@@ -235,13 +239,30 @@ class Problem(gp.GeneralProblem):
         self.listDict['force_wall_normal']['list'].append(error_f_normal)
         self.listDict['force_wall_shear']['list'].append(error_f_shear)
         if self.isWholeSecond:
-            self.listDict['force_wall']['slist'].append(
-                sqrt(sum([i*i for i in self.listDict['force_wall']['list'][self.N0:self.N1]])/self.stepsInSecond))
+            self.listDict['force_wall']['slist'].append(self.second_average(self.listDict['force_wall']['list']))
         print('  Relative force error:', error_force/an_force)
         self.tc.end('errorForce')
 
     def save_pressure(self, is_tent, pressure):
         super(Problem, self).save_pressure(is_tent, pressure)
+        analytic_pressure = womersleyBC.analytic_pressure(self.factor, self.actual_time)
+        self.sol_p = interpolate(analytic_pressure, self.pSpace)  # NT move to update_time
+        if self.ec_this_step:
+            self.compute_pressure_err(is_tent, pressure)
+        if self.doSaveDiff:
+            analytic_gradient = womersleyBC.analytic_pressure_grad(self.factor, self.actual_time)
+            sol_pg_expr = Expression(("0", "0", "pg"), pg=analytic_gradient / self.pg_normalization_factor[0])
+            # sol_pg = interpolate(sol_pg_expr, self.pgSpace)
+            # plot(sol_p, title="sol")
+            # plot(pressure, title="p")
+            # plot(pressure - sol_p, interactive=True, title="diff")
+            # exit()
+            self.pFunction.assign(pressure-self.sol_p)
+            self.write_xdmf('p2D' if is_tent else 'pD', self.pFunction)
+            # self.pgFunction.assign(pg-sol_pg)
+            # self.fileDict['pg2D' if is_tent else 'pgD'][0] << self.pgFunction
+
+    def compute_pressure_err(self, is_tent, pressure):
         self.tc.start('computePG')
         # Report pressure gradient
         p_in = assemble((1.0/self.area) * pressure * self.dsIn)
@@ -251,34 +272,21 @@ class Problem(gp.GeneralProblem):
         self.tc.end('computePG')
         self.tc.start('analyticP')
         analytic_gradient = womersleyBC.analytic_pressure_grad(self.factor, self.actual_time)
-        analytic_pressure = womersleyBC.analytic_pressure(self.factor, self.actual_time)
-        self.sol_p = interpolate(analytic_pressure, self.pSpace)  # NT move to update_time
         if not is_tent:
             self.last_analytic_pressure_norm = norm(self.sol_p, norm_type='L2')
-            self.listDict['ap_norm']['list'].append(self.last_analytic_pressure_norm)
+            self.append_sample('ap_norm', self.last_analytic_pressure_norm)
         self.tc.end('analyticP')
         self.tc.start('errorP')
         error = errornorm(self.sol_p, pressure, norm_type="l2", degree_rise=0)
-        self.listDict['p2' if is_tent else 'p']['list'].append(error)
+        self.append_sample('p2' if is_tent else 'p', error)
         print("Normalized pressure error norm:", error/self.p_normalization_factor[0])
-        self.listDict['pg2' if is_tent else 'pg']['list'].append(computed_gradient)
+        self.append_sample('pg2' if is_tent else 'pg', computed_gradient)
         if not is_tent:
-            self.listDict['apg']['list'].append(analytic_gradient)
-        self.listDict['pgE2' if is_tent else 'pgE']['list'].append(computed_gradient-analytic_gradient)
-        self.listDict['pgEA2' if is_tent else 'pgEA']['list'].append(abs(computed_gradient-analytic_gradient))
+            self.append_sample('apg', analytic_gradient)
+        self.append_sample('pgE2' if is_tent else 'pgE', computed_gradient-analytic_gradient)
+        self.append_sample('pgEA2' if is_tent else 'pgEA', abs(computed_gradient-analytic_gradient))
         if self.isWholeSecond:
             for key in (['pgE2', 'p2'] if is_tent else ['pgE', 'p']):
-                self.listDict[key]['slist'].append(
-                    sqrt(sum([i*i for i in self.listDict[key]['list'][self.N0:self.N1]])/self.stepsInSecond))
+                self.listDict[key]['slist'].append(self.second_average(self.listDict[key]['list'],
+                                                                       steps=self.listDict[key]['steps']))
         self.tc.end('errorP')
-        if self.doSaveDiff:
-            sol_pg_expr = Expression(("0", "0", "pg"), pg=analytic_gradient / self.pg_normalization_factor[0])
-            # sol_pg = interpolate(sol_pg_expr, self.pgSpace)
-            # plot(sol_p, title="sol")
-            # plot(pressure, title="p")
-            # plot(pressure - sol_p, interactive=True, title="diff")
-            # exit()
-            self.pFunction.assign(pressure-self.sol_p)
-            self.fileDict['p2D' if is_tent else 'pD']['file'] << self.pFunction
-            # self.pgFunction.assign(pg-sol_pg)
-            # self.fileDict['pg2D' if is_tent else 'pgD'][0] << self.pgFunction
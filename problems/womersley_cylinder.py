@@ -1,10 +1,12 @@
 from __future__ import print_function
-from dolfin import assemble, interpolate, Expression, Function, DirichletBC, norm, errornorm, Constant
+from dolfin import assemble, interpolate, Expression, Function, DirichletBC, norm, errornorm, Constant, TrialFunction, \
+    TestFunction
 from dolfin.cpp.common import toc, mpi_comm_world, DOLFIN_EPS
 from dolfin.cpp.io import HDF5File
 from dolfin.cpp.mesh import Mesh, MeshFunction
 from ufl import Measure, dx, cos, sin, FacetNormal, inner, grad, outer, Identity, sym
 from math import pi, sqrt
+import numpy as np
 
 from problems import general_problem as gp
 import womersleyBC
@@ -43,7 +45,7 @@ class Problem(gp.GeneralProblem):
         self.mesh_volume = pi*25.*20.
 
         # Import gmsh mesh
-        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh)
+        self.mesh, self.facet_function = super(Problem, self).loadMesh(args.mesh, self.build_cache)
         self.dsIn = Measure("ds", subdomain_id=2, subdomain_data=self.facet_function)
         self.dsOut = Measure("ds", subdomain_id=3, subdomain_data=self.facet_function)
         self.dsWall = Measure("ds", subdomain_id=1, subdomain_data=self.facet_function)
@@ -54,6 +56,14 @@ class Problem(gp.GeneralProblem):
 
         self.actual_time = None
         self.sol_p = None
+        self.analytic_gradient = None
+        # precomputed data for pressure errors (see prepare_pressure_error())
+        self.z_coordinate = None
+        self.p_mass_matrix = None
+        self.z_mass_product = None
+        self.z_norm_sq = None
+        self.p_in_weights = None
+        self.p_out_weights = None
         self.last_analytic_pressure_norm = None
         self.v_in = None
         self.area = None
@@ -67,6 +77,11 @@ class Problem(gp.GeneralProblem):
         self.bessel_real = []
         self.bessel_complex = []
         self.coefs_exp = [-8, -6, -4, -2, 2, 4, 6, 8]
+        # precomputed data for analytic norms and errors (see prepare_error_matrices())
+        self.solution_coefs = None
+        self.error_matrices = {}
+        self.mode_products = {}
+        self.gram = {}
 
         self.listDict.update({
             'u_H1w': {'list': [], 'name': 'corrected velocity H1 error on wall', 'abrev': 'CE_H1w', 'scale': self.scale_factor,
@@ -107,10 +122,13 @@ class Problem(gp.GeneralProblem):
         self.v_in = Function(V)
         print('Initializing error control')
         self.load_precomputed_bessel_functions(PS)
+        self.prepare_error_matrices()
         self.solution = self.assemble_solution(0.0)
 
         # set constants for
         self.area = assemble(interpolate(Expression("1.0"), Q) * self.dsIn)  # inflow area
+        self.prepare_pressure_error()
+        self.sol_p = Function(Q)
 
         # womersley = steady + e^iCt, e^iCt has average 0
         self.pg_normalization_factor.append(womersleyBC.average_analytic_pressure_grad(self.factor))
@@ -185,15 +203,18 @@ class Problem(gp.GeneralProblem):
 
         # construct analytic pressure (used for computing pressure and force errors)
         self.tc.start('analyticP')
-        analytic_pressure = womersleyBC.analytic_pressure(self.factor, self.actual_time)
-        self.sol_p = interpolate(analytic_pressure, self.pSpace)
+        self.analytic_gradient = womersleyBC.analytic_pressure_grad(self.factor, self.actual_time)
+        self.sol_p.vector().zero()
+        self.sol_p.vector().axpy(self.analytic_gradient, self.z_coordinate.vector())
         self.tc.end('analyticP')
 
+        if not self.ec_this_step:
+            return
         self.tc.start('analyticVnorms')
-        self.analytic_v_norm_L2 = norm(self.solution, norm_type='L2')
-        self.analytic_v_norm_H1 = norm(self.solution, norm_type='H1')
-        self.analytic_v_norm_H1w = sqrt(assemble((inner(grad(self.solution), grad(self.solution)) +
-                                                  inner(self.solution, self.solution)) * self.dsWall))
+        self.solution_coefs = self.mode_coefficients(self.actual_time)
+        self.analytic_v_norm_L2 = sqrt(self.analytic_norm_sq('L2'))
+        self.analytic_v_norm_H1 = sqrt(self.analytic_norm_sq('L2') + self.analytic_norm_sq('H1s'))
+        self.analytic_v_norm_H1w = sqrt(self.analytic_norm_sq('H1w'))
         self.listDict['av_norm_L2']['list'].append(self.analytic_v_norm_L2)
         self.listDict['av_norm_H1']['list'].append(self.analytic_v_norm_H1)
         self.listDict['av_norm_H1w']['list'].append(self.analytic_v_norm_H1w)
@@ -213,6 +234,60 @@ class Problem(gp.GeneralProblem):
             self.tc.end('assembleSol')
         return sol
 
+    def mode_coefficients(self, t):
+        """coefficients of modes [parabolic, real0..7, imag0..7] in Womersley solution for time t"""
+        coefs_exp = np.array(self.coefs_exp)
+        return self.factor * np.concatenate(([1.0], np.cos(coefs_exp * pi * t), -np.sin(coefs_exp * pi * t)))
+
+    def prepare_error_matrices(self):
+        """Precomputes matrices for analytic norms and velocity errors without assembling forms every step.
+        Solution is linear combination of modes S_j with coefficients c(t) and for each norm given by matrix A:
+            ||u||^2 = c^T G c,  ||v - u||^2 = v^T A v - 2 (v^T A S) c + c^T G c,  where G = S^T A S (Gram matrix)"""
+        u = TrialFunction(self.vSpace)
+        v = TestFunction(self.vSpace)
+        self.error_matrices = {
+            'L2': assemble(inner(u, v) * dx),
+            'H1s': assemble(inner(grad(u), grad(v)) * dx),
+            'H1w': assemble((inner(grad(u), grad(v)) + inner(u, v)) * self.dsWall),
+        }
+        dofs2 = self.vSpace.sub(2).dofmap().dofs()  # gives field of indices corresponding to z axis
+        modes = []
+        for fce in [self.bessel_parabolic] + self.bessel_real + self.bessel_complex:
+            mode = Function(self.vSpace)
+            mode.vector()[dofs2] = fce.vector().array()
+            modes.append(mode.vector())
+        for key, A in self.error_matrices.iteritems():
+            self.mode_products[key] = [A * mode for mode in modes]
+            self.gram[key] = np.array([[mode.inner(product) for product in self.mode_products[key]] for mode in modes])
+
+    def analytic_norm_sq(self, key):
+        return self.solution_coefs.dot(self.gram[key]).dot(self.solution_coefs)
+
+    def error_sq(self, key, velocity):
+        """squared norm given by error_matrices[key] of velocity - solution"""
+        x = velocity.vector()
+        products = np.array([product.inner(x) for product in self.mode_products[key]])
+        error_sq = x.inner(self.error_matrices[key] * x) - 2 * products.dot(self.solution_coefs) + \
+            self.analytic_norm_sq(key)
+        return max(error_sq, 0.0)  # can be slightly negative due to round-off for very small errors
+
+    def velocity_error_sq(self, velocity):
+        if velocity.vector().size() != self.vSpace.dim():  # e. g. velocity as subfunction of mixed space
+            return super(Problem, self).velocity_error_sq(velocity)
+        return self.error_sq('L2', velocity), self.error_sq('H1s', velocity)
+
+    def prepare_pressure_error(self):
+        """Analytic pressure is g(t)*z, so its norm, pressure error and averages of pressure on inflow and outflow
+        are computed from precomputed vectors (for pressure p: ||p - g*z||^2 = p^T M p - 2 g p^T M z + g^2 z^T M z)"""
+        self.z_coordinate = interpolate(Expression('x[2]'), self.pSpace)
+        p = TrialFunction(self.pSpace)
+        q = TestFunction(self.pSpace)
+        self.p_mass_matrix = assemble(p * q * dx)
+        self.z_mass_product = self.p_mass_matrix * self.z_coordinate.vector()
+        self.z_norm_sq = self.z_coordinate.vector().inner(self.z_mass_product)
+        self.p_in_weights = assemble((1.0/self.area) * q * self.dsIn)
+        self.p_out_weights = assemble((1.0/self.area) * q * self.dsOut)
+
     # load precomputed Bessel functions
     def load_precomputed_bessel_functions(self, PS):
         f = HDF5File(mpi_comm_world(), 'precomputed/precomputed_' + self.precomputed_filename + '.hdf5', 'r')
@@ -232,18 +307,23 @@ class Problem(gp.GeneralProblem):
 
     def compute_err(self, is_tent, velocity, t):
         super(Problem, self).compute_err(is_tent, velocity, t)
+        if not self.ec_this_step:
+            return
         er_list_H1w = self.listDict['u2H1w' if is_tent else 'u_H1w']['list']
-        errorH1wall = sqrt(assemble((inner(grad(velocity - self.solution), grad(velocity - self.solution)) +
-                                     inner(velocity - self.solution, velocity - self.solution)) * self.dsWall))
+        if velocity.vector().size() == self.vSpace.dim():
+            errorH1wall = sqrt(self.error_sq('H1w', velocity))
+        else:
+            errorH1wall = sqrt(self.assemble_form((inner(grad(velocity - self.solution), grad(velocity - self.solution)) +
+                                                   inner(velocity - self.solution, velocity - self.solution)) * self.dsWall))
         er_list_H1w.append(errorH1wall)
         print('  Relative H1wall error:', errorH1wall / self.analytic_v_norm_H1w)
         if self.isWholeSecond:
-            self.listDict['u2H1w' if is_tent else 'u_H1w']['slist'].append(
-                sqrt(sum([i*i for i in er_list_H1w[self.N0:self.N1]])/self.stepsInSecond))
+            self.listDict['u2H1w' if is_tent else 'u_H1w']['slist'].append(self.second_average(er_list_H1w))
 
     def compute_functionals(self, velocity, pressure, t):
         super(Problem, self).compute_functionals(velocity, pressure, t)
-        self.compute_force(velocity, pressure, t)
+        if self.ec_this_step:
+            self.compute_force(velocity, pressure, t)
 
     def compute_force(self, velocity, pressure, t):
         self.tc.start('errorForce')
@@ -251,23 +331,23 @@ class Problem(gp.GeneralProblem):
         def T(p, v):
             return -p * I + 2.0 * self.nu * sym(grad(v))
         error_force = sqrt(
-                assemble(inner((T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal,
-                               (T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal) * self.dsWall))
-        an_force = sqrt(assemble(inner(T(self.sol_p, self.solution) * self.normal,
-                                            T(self.sol_p, self.solution) * self.normal) * self.dsWall))
-        an_f_normal = sqrt(assemble(inner(inner(T(self.sol_p, self.solution) * self.normal, self.normal),
-                                               inner(T(self.sol_p, self.solution) * self.normal, self.normal)) * self.dsWall))
+                self.assemble_form(inner((T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal,
+                                         (T(pressure, velocity) - T(self.sol_p, self.solution)) * self.normal) * self.dsWall))
+        an_force = sqrt(self.assemble_form(inner(T(self.sol_p, self.solution) * self.normal,
+                                                      T(self.sol_p, self.solution) * self.normal) * self.dsWall))
+        an_f_normal = sqrt(self.assemble_form(inner(inner(T(self.sol_p, self.solution) * self.normal, self.normal),
+                                                         inner(T(self.sol_p, self.solution) * self.normal, self.normal)) * self.dsWall))
         error_f_normal = sqrt(
-                assemble(inner(inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal),
-                               inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal)) * self.dsWall))
+                self.assemble_form(inner(inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal),
+                                         inner((T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal, self.normal)) * self.dsWall))
         an_f_shear = sqrt(
-                assemble(inner((I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal,
-                               (I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal) * self.dsWall))
+                self.assemble_form(inner((I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal,
+                                         (I - outer(self.normal, self.normal)) * T(self.sol_p, self.solution) * self.normal) * self.dsWall))
         error_f_shear = sqrt(
-                assemble(inner((I - outer(self.normal, self.normal)) *
-                               (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal,
-                               (I - outer(self.normal, self.normal)) *
-                               (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal) * self.dsWall))
+                self.assemble_form(inner((I - outer(self.normal, self.normal)) *
+                                         (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal,
+                                         (I - outer(self.normal, self.normal)) *
+                                         (T(self.sol_p, self.solution) - T(pressure, velocity)) * self.normal) * self.dsWall))
         self.listDict['a_force_wall']['list'].append(an_force)
         self.listDict['a_force_wall_normal']['list'].append(an_f_normal)
         self.listDict['a_force_wall_shear']['list'].append(an_f_shear)
@@ -275,49 +355,63 @@ class Problem(gp.GeneralProblem):
         self.listDict['force_wall_normal']['list'].append(error_f_normal)
         self.listDict['force_wall_shear']['list'].append(error_f_shear)
         if self.isWholeSecond:
-            self.listDict['force_wall']['slist'].append(
-                sqrt(sum([i*i for i in self.listDict['force_wall']['list'][self.N0:self.N1]])/self.stepsInSecond))
+            self.listDict['force_wall']['slist'].append(self.second_average(self.listDict['force_wall']['list']))
         print('  Relative force error:', error_force/an_force)
         self.tc.end('errorForce')
 
     def save_pressure(self, is_tent, pressure):
         super(Problem, self).save_pressure(is_tent, pressure)
+        if self.ec_this_step:
+            self.compute_pressure_err(is_tent, pressure)
+        if self.doSaveDiff:
+            sol_pg_expr = Expression(("0", "0", "pg"), pg=self.analytic_gradient / self.pg_normalization_factor[0])
+            # sol_pg = interpolate(sol_pg_expr, self.pgSpace)
+            # plot(sol_p, title="sol")
+            # plot(pressure, title="p")
+            # plot(pressure - sol_p, interactive=True, title="diff")
+            # exit()
+            self.pFunction.assign(pressure-self.sol_p)
+            self.write_xdmf('p2D' if is_tent else 'pD', self.pFunction)
+            # self.pgFunction.assign(pg-sol_pg)
+            # self.fileDict['pg2D' if is_tent else 'pgD'][0] << self.pgFunction
+
+    def compute_pressure_err(self, is_tent, pressure):
+        # pressure from mixed space (direct solver) has different vector than precomputed ones
+        in_p_space = pressure.vector().size() == self.pSpace.dim()
         self.tc.start('computePG')
         # Report pressure gradient
-        p_in = assemble((1.0/self.area) * pressure * self.dsIn)
-        p_out = assemble((1.0/self.area) * pressure * self.dsOut)
+        if in_p_space:
+            p_in = self.p_in_weights.inner(pressure.vector())
+            p_out = self.p_out_weights.inner(pressure.vector())
+        else:
+            p_in = assemble((1.0/self.area) * pressure * self.dsIn)
+            p_out = assemble((1.0/self.area) * pressure * self.dsOut)
         computed_gradient = (p_out - p_in)/20.0
         # 20.0 is a length of a pipe NT should depend on mesh length (implement throuhg metadata or function of mesh)
         self.tc.end('computePG')
         self.tc.start('analyticP')
-        analytic_gradient = womersleyBC.analytic_pressure_grad(self.factor, self.actual_time)
+        analytic_gradient = self.analytic_gradient
         if not is_tent:
-            self.last_analytic_pressure_norm = norm(self.sol_p, norm_type='L2')
-            self.listDict['ap_norm']['list'].append(self.last_analytic_pressure_norm)
+            self.last_analytic_pressure_norm = abs(analytic_gradient) * sqrt(self.z_norm_sq)
+            self.append_sample('ap_norm', self.last_analytic_pressure_norm)
         self.tc.end('analyticP')
         self.tc.start('errorP')
-        error = errornorm(self.sol_p, pressure, norm_type="l2", degree_rise=0)
-        self.listDict['p2' if is_tent else 'p']['list'].append(error)
+        if in_p_space:
+            x = pressure.vector()
+            error_sq = x.inner(self.p_mass_matrix * x) - 2 * analytic_gradient * x.inner(self.z_mass_product) + \
+                analytic_gradient * analytic_gradient * self.z_norm_sq
+            error = sqrt(max(error_sq, 0.0))
+        else:
+            error = errornorm(self.sol_p, pressure, norm_type="l2", degree_rise=0)
+        self.append_sample('p2' if is_tent else 'p', error)
         print("Normalized pressure error norm:", error/self.p_normalization_factor[0])
-        self.listDict['pg2' if is_tent else 'pg']['list'].append(computed_gradient)
+        self.append_sample('pg2' if is_tent else 'pg', computed_gradient)
         if not is_tent:
-            self.listDict['apg']['list'].append(analytic_gradient)
-        self.listDict['pgE2' if is_tent else 'pgE']['list'].append(computed_gradient-analytic_gradient)
-        self.listDict['pgEA2' if is_tent else 'pgEA']['list'].append(abs(computed_gradient-analytic_gradient))
+            self.append_sample('apg', analytic_gradient)
+        self.append_sample('pgE2' if is_tent else 'pgE', computed_gradient-analytic_gradient)
+        self.append_sample('pgEA2' if is_tent else 'pgEA', abs(computed_gradient-analytic_gradient))
         if self.isWholeSecond:
             for key in (['pgE2', 'p2'] if is_tent else ['pgE', 'p']):
-                self.listDict[key]['slist'].append(
-                    sqrt(sum([i*i for i in self.listDict[key]['list'][self.N0:self.N1]])/self.stepsInSecond))
+                self.listDict[key]['slist'].append(self.second_average(self.listDict[key]['list'],
+                                                                       steps=self.listDict[key]['steps']))
         self.tc.end('errorP')
-        if self.doSaveDiff:
-            sol_pg_expr = Expression(("0", "0", "pg"), pg=analytic_gradient / self.pg_normalization_factor[0])
-            # sol_pg = interpolate(sol_pg_expr, self.pgSpace)
-            # plot(sol_p, title="sol")
-            # plot(pressure, title="p")
-            # plot(pressure - sol_p, interactive=True, title="diff")
-            # exit()
-            self.pFunction.assign(pressure-self.sol_p)
-            self.fileDict['p2D' if is_tent else 'pD']['file'] << self.pFunction
-            # self.pgFunction.assign(pg-sol_pg)
-            # self.fileDict['pg2D' if is_tent else 'pgD'][0] << self.pgFunction
-
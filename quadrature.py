@@ -0,0 +1,30 @@
+from __future__ import print_function
+from ufl import Form
+from ufl.algorithms import estimate_total_polynomial_degree
+
+# Per-form quadrature degree policy used by solvers and problems (instead of global
+# parameters['form_compiler']['quadrature_degree'], which over-integrates every form compiled afterwards):
+#   each integral is integrated with its estimated polynomial degree (as FFC does by default), but at most with cap
+#   degree set explicitly for single term, e.g. inner(u, v)*dx(metadata={'quadrature_degree': 4}), is kept
+#   cap 0 means no limit
+# cap is given by --qcap option (see GeneralSolver), by default 6 with stabilization (--cs or --stab), where SUPG terms
+#   are not polynomial and estimated degrees are too high, otherwise 0 (FFC estimates are kept)
+# solver_benchmark.py quadrature compares assembly times and errors for --qcap 0, 4 and 6
+
+
+def limit_degree(form, cap):
+    """returns form with quadrature degree of each integral set to min(estimated degree, cap)"""
+    if form is None or not cap:
+        return form
+    integrals = []
+    for integral in form.integrals():
+        metadata = dict(integral.metadata())
+        if 'quadrature_degree' not in metadata:
+            metadata['quadrature_degree'] = min(estimate_total_polynomial_degree(integral.integrand()), cap)
+        integrals.append(integral.reconstruct(metadata=metadata))
+    return Form(integrals)
+
+
+def degrees(form):
+    """returns list of quadrature degrees of integrals in form (None if not set)"""
+    return [integral.metadata().get('quadrature_degree') for integral in form.integrals()]
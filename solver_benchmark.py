@@ -0,0 +1,97 @@
+from __future__ import print_function
+import os
+import csv
+import argparse
+import subprocess
+
+# runs main.py for variants of options and compares time control watches and errors in last cycle, e.g.:
+#   python solver_benchmark.py quadrature
+#   python solver_benchmark.py quadrature --np 4 --time 2 --dt 0.01
+# presets (problem, solver, mesh, compared watches and variants of options) are listed in dictionary presets below
+#   quadrature: --qcap 0 (degrees estimated by FFC), 4 and 6 (default with stabilization) with consistent SUPG
+#   oseen: direct solver with Newton method (full and modified) and with Oseen linearization (--oseen)
+#   applybc: ipcs1 watches of applying boundary conditions (BCs of constant matrices are applied once)
+#   pressure: watches of analytic pressure, pressure error and pressure gradient of womersley_cylinder problem
+#             (pressure error and gradient are computed only in saved steps, so fields are saved with -S doSave)
+# results are printed and appended to solver_benchmark.csv (preset; tag; variant; quantity; value), to compare two
+# versions of code run the benchmark with different --tag in both checkouts (main.py of current directory is run), e.g.:
+#   git worktree add ../before [commit before change]   (meshes/ and precomputed/ are needed there too)
+#   cd ../before && python [this repository]/solver_benchmark.py applybc --tag before
+#   cd [this repository] && python solver_benchmark.py applybc --tag after
+# watches (and counters) are read from report_timecontrol.csv, errors (last_cycle_* columns) from report_h.csv
+
+presets = {
+    'quadrature': {
+        'problem': 'womersley_cylinder', 'solver': 'ipcs1', 'mesh': 'cyl_c2', 'time': 1.0, 'dt': 0.01,
+        'options': ['-s', 'direct', '--cs', '--stab', '1.0'],
+        'watches': ['Initial matrix assembly', 'Assembled A1 matrix (without stabiliz.)',
+                    'Assembled A1 stabilization'],
+        'variants': [('qcap0', ['--qcap', '0']), ('qcap4', ['--qcap', '4']), ('qcap6', ['--qcap', '6'])],
+    },
+    'oseen': {
+        'problem': 'womersley_cylinder', 'solver': 'direct', 'mesh': 'cyl_c1', 'time': 1.0, 'dt': 0.01,
+        'options': [],
+        'watches': ['Running nonlinear solver', 'Assembled and factorized Jacobian (modified Newton)',
+                    'Newton iterations', 'Jacobian factorizations'],
+        'variants': [('newton', []), ('modified', ['--newton', 'modified']), ('oseen', ['--oseen'])],
+    },
+    'applybc': {
+        'problem': 'womersley_cylinder', 'solver': 'ipcs1', 'mesh': 'cyl_c2', 'time': 1.0, 'dt': 0.01,
+        'options': [],
+        'watches': ['Applied velocity BC 1st step', 'Applied velocity BC 3rd step',
+                    'Applied pressure BC or othogonalized rhs'],
+        'variants': [('krylov', ['-s', 'krylov']), ('direct', ['-s', 'direct'])],
+    },
+    'pressure': {
+        'problem': 'womersley_cylinder', 'solver': 'ipcs1', 'mesh': 'cyl_c2', 'time': 1.0, 'dt': 0.01,
+        'options': ['-S', 'doSave'],
+        'watches': ['Analytic pressure', 'Computed pressure error', 'Computed pressure gradient'],
+        'variants': [('ipcs1', [])],
+    },
+}
+problem_codes = {'womersley_cylinder': 'WCYL', 'steady_cylinder': 'SCYL', 'FaC3D_benchmark': 'FACB', 'real': 'REAL'}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('preset', help='compared variants', choices=sorted(presets.keys()))
+parser.add_argument('--np', help='number of MPI processes (0 runs without mpirun)', type=int, default=0)
+parser.add_argument('--mesh', help='mesh name (overrides preset)')
+parser.add_argument('--time', help='total time (overrides preset)', type=float)
+parser.add_argument('--dt', help='time step (overrides preset)', type=float)
+parser.add_argument('--tag', help='label of tested version of code (used in run names and csv)', default='')
+args = parser.parse_args()
+preset = presets[args.preset]
+
+
+def read_report(file_name):
+    """returns dictionary {column: value} from csv file with header row and data row"""
+    with open(file_name, 'r') as report_file:
+        rows = list(csv.reader(report_file, delimiter=';', escapechar='|', quoting=csv.QUOTE_NONE))
+    return dict(zip(rows[0], rows[1]))
+
+
+results = []
+for (label, options) in preset['variants']:
+    name = '_'.join(filter(None, ['bench', args.preset, args.tag, label]))
+    command = ['python', 'main.py', preset['problem'], preset['solver'], args.mesh or preset['mesh'],
+               str(args.time or preset['time']), str(args.dt or preset['dt']), '-n', name] + \
+        preset['options'] + options
+    if args.np:
+        command = ['mpirun', '-n', str(args.np)] + command
+    print(' '.join(command))
+    with open(name + '.log', 'w') as log:
+        returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+    directory = '%s_%s_results' % (problem_codes[preset['problem']], name)
+    if returncode or not os.path.exists(directory + '/report_h.csv'):
+        print('  failed, see %s.log' % name)
+        continue
+    timecontrol = read_report(directory + '/report_timecontrol.csv')
+    report = read_report(directory + '/report_h.csv')
+    values = [('total time', timecontrol['Total time'])]
+    values += [(watch, timecontrol.get(watch, 'nan')) for watch in preset['watches']]
+    values += [(key, value) for (key, value) in sorted(report.items()) if key.startswith('last_cycle_')]
+    for (quantity, value) in values:
+        print('  %-45s %14.6g' % (quantity, float(value)))
+        results.append([args.preset, args.tag, label, quantity, value])
+
+with open('solver_benchmark.csv', 'a') as csv_file:
+    csv.writer(csv_file, delimiter=';', escapechar='|', quoting=csv.QUOTE_NONE).writerows(results)
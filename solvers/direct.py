@@ -1,4 +1,6 @@
 from __future__ import print_function
+import numpy as np
+from petsc4py import PETSc
 from dolfin import Function, VectorFunctionSpace, FunctionSpace, assemble, Expression, CellSize, DOLFIN_EPS, parameters, \
     plot, MixedFunctionSpace, DirichletBC, NonlinearVariationalProblem, NonlinearVariationalSolver
 from dolfin.cpp.common import info, begin, end
@@ -12,6 +14,40 @@ from ufl import dot, dx, grad, system, div, inner, sym, Identity, transpose, nab
 import general_solver as gs
 
 
+class PressureSchurPC(object):
+    """petsc4py python preconditioner for pressure block of fieldsplit solver (Cahouet-Chabard type):
+    Jacobian [[A, B^T], [theta B, 0]] with A ~ M_u/dt + theta nu L_u has Schur complement S = -theta B A^-1 B^T and
+        S^-1 ~ -(nu M_p^-1 + 1/(theta dt) L_p^-1)
+    where M_p is pressure mass matrix (inverted by CG with Jacobi) and L_p pressure Laplacian with Dirichlet condition
+    where pressure is prescribed (approximated by one AMG cycle), both are assembled once"""
+    def __init__(self, mass, laplace, nu, theta, dt):
+        self.mass_coefficient = -nu
+        self.laplace_coefficient = -1.0/(theta*dt)
+        self.mass_ksp = PETSc.KSP().create(mass.getComm())
+        self.mass_ksp.setOptionsPrefix('ns_schur_mass_')
+        self.mass_ksp.setOperators(mass)
+        self.mass_ksp.setType(PETSc.KSP.Type.CG)
+        self.mass_ksp.getPC().setType(PETSc.PC.Type.JACOBI)
+        self.mass_ksp.setTolerances(rtol=1E-6, max_it=50)
+        self.mass_ksp.setFromOptions()
+        self.laplace_ksp = PETSc.KSP().create(laplace.getComm())
+        self.laplace_ksp.setOptionsPrefix('ns_schur_laplace_')
+        self.laplace_ksp.setOperators(laplace)
+        self.laplace_ksp.setType(PETSc.KSP.Type.PREONLY)
+        self.laplace_ksp.getPC().setType(PETSc.PC.Type.HYPRE)
+        self.laplace_ksp.setFromOptions()
+        self.work = mass.createVecLeft()
+
+    def setUp(self, pc):
+        pass
+
+    def apply(self, pc, x, y):
+        self.mass_ksp.solve(x, y)
+        y.scale(self.mass_coefficient)
+        self.laplace_ksp.solve(x, self.work)
+        y.axpy(self.laplace_coefficient, self.work)
+
+
 class Solver(gs.GeneralSolver):
     def __init__(self, args, tc, metadata):
         gs.GeneralSolver.__init__(self, args, tc, metadata)
@@ -56,6 +92,16 @@ class Solver(gs.GeneralSolver):
         self.precision_rel_v_tent = args.prv1
         self.precision_abs_v_tent = args.pav1
         self.precision_p = args.pp
+        self.newton = args.newton
+        self.linear_solver = args.ls
+        self.oseen = args.oseen
+        self.refactor_ratio = args.refactor
+        # modified Newton method (see modified_newton())
+        self.jacobian_solver = None  # solver with factorized (or preconditioned) Jacobian
+        self.fields = None  # velocity and pressure index sets for fieldsplit solver
+        self.schur_pc = None  # PressureSchurPC for fieldsplit solver
+        self.refactor = True  # factorize Jacobian in next iteration
+        self.factorizations = 0
 
     def __str__(self):
         return 'ipcs1 - incremental pressure correction scheme with nonlinearity treated by Adam-Bashword + ' \
@@ -85,6 +131,108 @@ class Solver(gs.GeneralSolver):
         # "On conservation laws of Navier-Stokes Galerkin discretizations" (2016)
         parser.add_argument('--cs', help='Use consistent SUPG stabilisation.', action='store_true')
         parser.add_argument('--cbcDelta', help='Use simpler cbcflow parameter for SUPG', action='store_true')
+        parser.add_argument('--newton', help='Newton method', choices=['full', 'modified'], default='full')
+        #   full: NonlinearVariationalSolver, Jacobian is assembled and factorized in every iteration
+        #   modified: factorized Jacobian is reused in iterations and time steps while convergence is fast enough
+        parser.add_argument('--refactor', help='Modified Newton: factorize Jacobian when residual decreases slower '
+                                               'than by given ratio', type=float, default=0.5)
+        parser.add_argument('--oseen', help='Linearize convection with extrapolated velocity 1.5*u0 - 0.5*u1 (one linear '
+                                            'solve per time step)', action='store_true')
+        parser.add_argument('--ls', help='Linear solver for Newton method', choices=['mumps', 'fieldsplit'],
+                            default='mumps')
+        #   fieldsplit: GMRES with upper block triangular preconditioner (AMG for velocity block, Cahouet-Chabard
+        #               approximation of Schur complement, see PressureSchurPC), memory and time scale linearly with
+        #               mesh size, PETSc options with prefix ns_ can be changed by environment variable, e.g.
+        #               PETSC_OPTIONS='-ns_ksp_monitor -ns_ksp_gmres_restart 50' (convergence is not shown by default)
+
+    def prepare_fieldsplit(self, dw, q, bcp, theta):
+        """creates index sets of velocity and pressure dofs and PressureSchurPC with matrices assembled on mixed space
+        (bcp: Dirichlet conditions for pressure, applied to pressure Laplacian)"""
+        self.fields = [(name, PETSc.IS().createGeneral(np.array(space.dofmap().dofs(), dtype=PETSc.IntType)))
+                       for (name, space) in [('u', self.W.sub(0)), ('p', self.W.sub(1))]]
+        pressure_is = self.fields[1][1]
+        (du, dp) = split(dw)
+        mass = assemble(self.limit_degree(dp*q*dx))
+        laplace = assemble(self.limit_degree(inner(grad(dp), grad(q))*dx))
+        [bc.apply(laplace) for bc in bcp]
+        mass, laplace = [as_backend_type(M).mat().getSubMatrix(pressure_is, pressure_is) for M in [mass, laplace]]
+        if not bcp:  # nullspace modes: pressure Laplacian is singular (constants)
+            laplace.setNullSpace(PETSc.NullSpace().create(constant=True, comm=laplace.getComm()))
+        self.schur_pc = PressureSchurPC(mass, laplace, nu=self.problem.nu, theta=theta, dt=self.metadata['dt'])
+
+    def fieldsplit_solver(self, A):
+        """GMRES solver for Jacobian A of mixed system with PETSc fieldsplit preconditioner"""
+        solver = PETScKrylovSolver('gmres')
+        solver.set_operators(A, A)
+        solver.parameters['relative_tolerance'] = 1E-10
+        solver.parameters['absolute_tolerance'] = 1E-12
+        solver.parameters['maximum_iterations'] = 1000
+        ksp = solver.ksp()
+        ksp.setOptionsPrefix('ns_')
+        pc = ksp.getPC()
+        pc.setType(PETSc.PC.Type.FIELDSPLIT)
+        pc.setFieldSplitIS(*self.fields)
+        PETScOptions.set('ns_ksp_gmres_restart', 100)
+        PETScOptions.set('ns_pc_fieldsplit_type', 'schur')
+        PETScOptions.set('ns_pc_fieldsplit_schur_fact_type', 'upper')
+        PETScOptions.set('ns_pc_fieldsplit_schur_precondition', 'a11')  # zero block, not used by PressureSchurPC
+        PETScOptions.set('ns_fieldsplit_u_ksp_type', 'preonly')
+        PETScOptions.set('ns_fieldsplit_u_pc_type', 'hypre')
+        PETScOptions.set('ns_fieldsplit_u_pc_hypre_type', 'boomeramg')
+        PETScOptions.set('ns_fieldsplit_p_ksp_type', 'preonly')
+        PETScOptions.set('ns_fieldsplit_p_pc_type', 'none')  # replaced by PressureSchurPC below
+        ksp.setFromOptions()
+        ksp.setUp()
+        schur_pc = pc.getFieldSplitSubKSP()[1].getPC()
+        schur_pc.setType(PETSc.PC.Type.PYTHON)
+        schur_pc.setPythonContext(self.schur_pc)
+        return solver
+
+    def modified_newton(self, F, J, w, bcs, absolute_tolerance=1E-08, relative_tolerance=1E-08,
+                        maximum_iterations=50):
+        """Solves F(w) = 0 by Newton method with Jacobian J reused while residual decreases at least by refactor_ratio
+        (with --newton full Jacobian is updated in every iteration). Returns number of iterations."""
+        bcs_hom = [DirichletBC(bc) for bc in bcs]
+        for bc in bcs_hom:
+            bc.homogenize()
+        [bc.apply(w.vector()) for bc in bcs]
+        dw = Vector(w.vector())
+
+        def residual():
+            b = assemble(F)
+            [bc.apply(b) for bc in bcs_hom]
+            return b, b.norm('l2')
+
+        b, residual_norm = residual()
+        residual_norm0 = residual_norm
+        iterations = 0
+        while residual_norm > absolute_tolerance and residual_norm > relative_tolerance * residual_norm0:
+            if iterations == maximum_iterations:
+                raise RuntimeError('Modified Newton method did not converge in %d iterations.' % iterations)
+            if self.refactor or self.jacobian_solver is None:
+                self.tc.end('solve')  # factorization is measured separately
+                self.tc.start('factorize')
+                A = assemble(J)
+                [bc.apply(A) for bc in bcs_hom]
+                if self.linear_solver == 'fieldsplit':
+                    self.jacobian_solver = self.fieldsplit_solver(A)
+                else:
+                    self.jacobian_solver = LUSolver(A, 'mumps')
+                    self.jacobian_solver.parameters['reuse_factorization'] = True
+                self.factorizations += 1
+                self.refactor = False
+                self.tc.end('factorize')
+                self.tc.start('solve')
+            self.jacobian_solver.solve(dw, b)
+            w.vector().axpy(-1.0, dw)
+            iterations += 1
+            previous_norm = residual_norm
+            b, residual_norm = residual()
+            info('Modified Newton iteration %d: residual %.3e (ratio %.3f)' % (iterations, residual_norm,
+                                                                              residual_norm / previous_norm))
+            if self.newton == 'full' or residual_norm > self.refactor_ratio * previous_norm:
+                self.refactor = True
+        return iterations
 
     def solve(self, problem):
         self.problem = problem
@@ -96,6 +244,10 @@ class Solver(gs.GeneralSolver):
         nu = Constant(self.problem.nu)
         self.tc.init_watch('init', 'Initialization', True, count_to_percent=False)
         self.tc.init_watch('solve', 'Running nonlinear solver', True, count_to_percent=True)
+        self.tc.init_watch('factorize', 'Assembled and factorized Jacobian (modified Newton)', True,
+                           count_to_percent=True)
+        self.tc.init_counter('newton_it', 'Newton iterations')
+        self.tc.init_counter('factorizations', 'Jacobian factorizations')
         self.tc.init_watch('next', 'Next step assignments', True, count_to_percent=True)
         self.tc.init_watch('saveVel', 'Saved velocity', True)
 
@@ -129,26 +281,37 @@ class Solver(gs.GeneralSolver):
         k = Constant(self.metadata['dt'])
 
         # Initial conditions: u0 velocity at previous time step u1 velocity two time steps back p0 previous pressure
-        [u0, p0] = self.problem.get_initial_conditions([{'type': 'v', 'time': 0.0}, {'type': 'p', 'time': 0.0}])
+        [u1, u0, p0] = self.problem.get_initial_conditions([{'type': 'v', 'time': -dt},
+                                                          {'type': 'v', 'time': 0.0},
+                                                          {'type': 'p', 'time': 0.0}])
 
         if doSave:
             problem.save_vel(False, u0, 0.0)
 
         # boundary conditions
         bcu, bcp = problem.get_boundary_conditions(self.bc == 'outflow', self.W.sub(0), self.W.sub(1))
-        # NT bcp is not used
+        # NT bcp is not used (only in pressure Laplacian of fieldsplit preconditioner)
 
         # Define steady part of the equation
         def T(u):
             return -p * I + 2.0 * nu * sym(grad(u))
 
-        def F(u, v, q):
-            return (inner(T(u), grad(v)) - q * div(u)) * dx + inner(grad(u) * u, v) * dx
+        def F(u, v, q, u_conv):
+            return (inner(T(u), grad(v)) - q * div(u)) * dx + inner(grad(u) * u_conv, v) * dx
 
         # Define variational forms
-        F_ns = (inner((u - u0), v) / k) * dx + (1.0 - theta) * F(u0, v, q) + theta * F(u, v, q)
+        if self.oseen:
+            # Oseen linearization: problem is linear, so Newton method converges after one linear solve
+            info('Using convection linearized with extrapolated velocity.')
+            u_ext = 1.5*u0 - 0.5*u1
+            F_ns = (inner((u - u0), v) / k) * dx + (1.0 - theta) * F(u0, v, q, u_ext) + theta * F(u, v, q, u_ext)
+        else:
+            F_ns = (inner((u - u0), v) / k) * dx + (1.0 - theta) * F(u0, v, q, u0) + theta * F(u, v, q, u)
         J_ns = derivative(F_ns, w, dw)
         # J_ns = derivative(F_ns, w)  # did not work
+        # quadrature degree of each form is estimated and limited by --qcap
+        F_ns = self.limit_degree(F_ns)
+        J_ns = self.limit_degree(J_ns)
 
         # NS_problem = NonlinearVariationalProblem(F_ns, w, bcu, J_ns, form_compiler_parameters=ffc_options)
         NS_problem = NonlinearVariationalProblem(F_ns, w, bcu, J_ns)
@@ -163,6 +326,15 @@ class Solver(gs.GeneralSolver):
         prm['newton_solver']['linear_solver'] = 'mumps'
 
         info(NS_solver.parameters, True)
+        if self.linear_solver == 'fieldsplit':
+            info('Using GMRES with fieldsplit preconditioner for Newton iterations')
+            self.prepare_fieldsplit(dw, q, bcp, theta)
+        if self.newton == 'modified':
+            info('Using modified Newton method (Jacobian factorized when residual ratio > %.2f)' % self.refactor_ratio)
+
+        # Newton iterations and Jacobian factorizations in every time step
+        problem.listDict['newton_it'] = {'list': [], 'name': 'Newton iterations', 'abrev': 'NIT'}
+        problem.listDict['factorizations'] = {'list': [], 'name': 'Jacobian factorizations', 'abrev': 'NFAC'}
 
         self.tc.end('init')
 
@@ -184,7 +356,20 @@ class Solver(gs.GeneralSolver):
             begin("Solving NS ....")
             try:
                 self.tc.start('solve')
-                NS_solver.solve()
+                factorizations = self.factorizations
+                if self.newton == 'modified' or self.linear_solver == 'fieldsplit':
+                    iterations = self.modified_newton(F_ns, J_ns, w, bcu, prm['newton_solver']['absolute_tolerance'],
+                                                      prm['newton_solver']['relative_tolerance'])
+                    factorizations = self.factorizations - factorizations
+                else:
+                    iterations = NS_solver.solve()[0]
+                    factorizations = iterations
+                    self.factorizations += factorizations
+                problem.listDict['newton_it']['list'].append(iterations)
+                problem.listDict['factorizations']['list'].append(factorizations)
+                self.tc.count('newton_it', iterations)
+                self.tc.count('factorizations', factorizations)
+                info('Newton iterations: %d, Jacobian factorizations: %d' % (iterations, factorizations))
                 self.tc.end('solve')
             except RuntimeError as inst:
                 problem.report_fail(t)
@@ -220,11 +405,16 @@ class Solver(gs.GeneralSolver):
 
             # Move to next time step
             self.tc.start('next')
+            u1.assign(u0)
             u0.assign(velSp)
             t = round(t + dt, 6)  # round time step to 0.000001
             step += 1
             self.tc.end('next')
 
         info("Finished: direct method")
+        newton_it = problem.listDict['newton_it']['list']
+        info('Newton iterations: %d, Jacobian factorizations: %d' % (sum(newton_it), self.factorizations))
+        self.metadata['newton_iterations'] = sum(newton_it)
+        self.metadata['factorizations'] = self.factorizations
         problem.report()
         return 0
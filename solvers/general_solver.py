@@ -1,8 +1,11 @@
 from __future__ import print_function
 
-from dolfin import parameters
+import numpy as np
+from dolfin import parameters, assemble
 from dolfin.cpp.common import info, MPI, mpi_comm_world
 
+from quadrature import limit_degree
+
 
 class GeneralSolver:
     def __init__(self, args, tc, metadata):
@@ -23,17 +26,84 @@ class GeneralSolver:
             parameters["form_compiler"]["optimize"] = True  # NT maybe do nothing with uflacs
         if args.ffc == 'uflacs' or args.ffc == 'uflacs_opt':
             parameters["form_compiler"]["representation"] = "uflacs"
+        if args.qcap is None:
+            # by default only stabilized forms (not polynomial) are capped, args are shared with problem
+            args.qcap = 6 if getattr(args, 'cs', False) or getattr(args, 'stab', 0.) > 0. else 0
+        self.quadrature_cap = args.qcap
 
     @staticmethod
     def setup_parser_options(parser):
         parser.add_argument('--ffc', help='Form compiler options', choices=['auto_opt', 'uflacs', 'uflacs_opt', 'auto'], default='uflacs_opt')
+        parser.add_argument('--qcap', help='maximal quadrature degree of forms (0 for no limit, default 6 with --cs or '
+                                           '--stab, otherwise 0)', type=int)
 
     def initialize(self, options):
         pass
 
+    def limit_degree(self, form):
+        """returns form with quadrature degree of integrals limited by --qcap (see quadrature.py)"""
+        return limit_degree(form, self.quadrature_cap)
+
+    def assemble_constant_matrix(self, name, form, space):
+        """assembles matrix of bilinear form on FunctionSpace space, or loads it from problem.build_cache if enabled"""
+        cache = self.problem.build_cache
+        if cache is None:
+            return assemble(form)
+        if cache.has_matrix(name):
+            return cache.load_matrix(name, space)
+        matrix = assemble(form)
+        cache.save_matrix(name, matrix)
+        return matrix
+
     def solve(self, problem):
         pass
 
     def solve_step(self, dt):
         pass
 
+
+class ProjectedInitialGuess(object):
+    """Initial guesses for repeated solves of system with constant matrix A and changing right hand side b.
+    Guess is Galerkin projection of solution onto span of (at most size) previous solutions x_i:
+        x = sum c_i x_i,  where (x_i^T A x_j) c = (x_i^T b)
+    When basis is full, it is restarted with last solution (P. F. Fischer, Projection techniques for iterative
+    solution of Ax=b with successive right-hand sides, 1998)."""
+    def __init__(self, A, size):
+        self.A = A
+        self.size = size
+        self.basis = []
+        self.products = []  # A*x_i
+        self.gram = np.zeros((0, 0))  # x_i^T A x_j
+
+    def guess(self, x, b):
+        """sets vector x to projected solution of Ax=b"""
+        if not self.basis:
+            return
+        rhs = np.array([v.inner(b) for v in self.basis])
+        coefs = np.linalg.lstsq(self.gram, rhs, rcond=1e-12)[0]
+        x.zero()
+        for c, v in zip(coefs, self.basis):
+            x.axpy(c, v)
+
+    def add(self, x):
+        """adds solution x to basis"""
+        if len(self.basis) == self.size:
+            self.basis = []
+            self.products = []
+            self.gram = np.zeros((0, 0))
+        norm = x.norm('l2')
+        if norm == 0.0:
+            return
+        v = x.copy()
+        v *= 1.0/norm
+        Av = self.A * v
+        row = [v.inner(Avi) for Avi in self.products]
+        column = [vi.inner(Av) for vi in self.basis]
+        gram = np.zeros((len(self.basis) + 1,)*2)
+        gram[:-1, :-1] = self.gram
+        gram[-1, :-1] = row
+        gram[:-1, -1] = column
+        gram[-1, -1] = v.inner(Av)
+        self.gram = gram
+        self.basis.append(v)
+        self.products.append(Av)
@@ -1,7 +1,7 @@
 from __future__ import print_function
-from dolfin import Function, VectorFunctionSpace, FunctionSpace, assemble, Expression, CellSize, DOLFIN_EPS, parameters, \
-    plot
-from dolfin.cpp.common import info, begin, end
+import numpy as np
+from dolfin import Function, VectorFunctionSpace, FunctionSpace, assemble, Expression, CellSize, DOLFIN_EPS, plot
+from dolfin.cpp.common import info, begin, end, toc, MPI, mpi_comm_world
 from dolfin.cpp.function import FunctionAssigner
 from dolfin.cpp.la import LUSolver, KrylovSolver, as_backend_type, VectorSpaceBasis, Vector, PETScKrylovSolver, \
     PETScOptions
@@ -9,6 +9,7 @@ from dolfin.functions import TrialFunction, TestFunction, Constant, FacetNormal
 from ufl import dot, dx, grad, system, div, inner, sym, Identity, transpose, nabla_grad, sqrt, min_value
 
 import general_solver as gs
+from quadrature import degrees
 
 # QQ split rotation, lagrange scheme?
 # (implement as this Solver subclass? Can class be subclass of class with same name?)
@@ -16,6 +17,9 @@ import general_solver as gs
 
 
 class Solver(gs.GeneralSolver):
+    # convection treated explicitly by Adams-Bashforth (A1 is constant), used by subclass in ipcs_ab.py
+    explicit_convection = False
+
     def __init__(self, args, tc, metadata):
         gs.GeneralSolver.__init__(self, args, tc, metadata)
         self.metadata['hasTentativeV'] = True
@@ -55,10 +59,31 @@ class Solver(gs.GeneralSolver):
         self.use_ema = args.ema
         self.cbcDelta = args.cbcDelta
         self.prec_v = args.precV
+        self.lag_v = args.lagV
+        self.lag_v_ratio = args.lagVratio
+        self.prec_v_age = None  # number of solves with current preconditioner of A1
+        self.prec_v_iterations = None  # iterations of first solve with current preconditioner of A1
+        self.solve1_times = {True: [], False: []}  # times of tentative velocity solves with/without rebuild
         self.prec_p = args.precP
         self.precision_rel_v_tent = args.prv1
         self.precision_abs_v_tent = args.pav1
         self.precision_p = args.pp
+        self.decouple = args.decouple
+        # data for solving velocity components separately (see prepare_decoupling())
+        self.split_v = None
+        self.merge_v = None
+        self.v_components = None
+        self.b_components = None
+        self.bc_components = None
+        self.b_V = None
+        self.bc_V = None
+        self.bc_rows = None
+        self.guess = args.guess
+        self.recycle = args.recycle
+        self.p_projection = None
+        # history of solution vectors for each substep (newest first) used to extrapolate initial guesses
+        self.guess_history = {}
+        self.iterations = {}  # numbers of Krylov iterations for each substep
 
     def __str__(self):
         return 'ipcs1 - incremental pressure correction scheme with nonlinearity treated by Adam-Bashword + ' \
@@ -71,9 +96,20 @@ class Solver(gs.GeneralSolver):
         parser.add_argument('--prv1', help='relative tentative velocity Krylov solver precision', type=int, default=6)
         parser.add_argument('--pav1', help='absolute tentative velocity Krylov solver precision', type=int, default=10)
         parser.add_argument('--pp', help='pressure Krylov solver precision', type=int, default=10)
+        parser.add_argument('--guess', help='Initial guess for Krylov solvers', choices=['prev', 'ext2', 'ext3'],
+                            default='prev')
+        #   prev: solution of substep from previous time step (or corrected velocity for tentative velocity)
+        #   ext2, ext3: extrapolation of second/third order from solutions of substep in previous time steps
+        parser.add_argument('--recycle', help='Initial guess for pressure solver projected onto n previous solutions '
+                                              '(0: use --guess)', type=int, default=0)
         parser.add_argument('-b', '--bc', help='Pressure boundary condition mode',
                             choices=['outflow', 'nullspace', 'nullspace_s', 'lagrange'], default='outflow')
         parser.add_argument('--precV', help='Preconditioner for tentative velocity solver', type=str, default='ilu')
+        parser.add_argument('--lagV', help='Rebuild preconditioner for tentative velocity solver every n-th step',
+                            type=int, default=1)
+        parser.add_argument('--lagVratio', help='Rebuild preconditioner for tentative velocity solver also when number '
+                                                'of iterations rises above ratio*(iterations after last rebuild)',
+                            type=float, default=1.5)
         parser.add_argument('--precP', help='Preconditioner for pressure solver', choices=['hypre_amg', 'ilu'],
                             default='hypre_amg')
         parser.add_argument('-r', help='Use rotation scheme', action='store_true')
@@ -88,6 +124,122 @@ class Solver(gs.GeneralSolver):
         # "On conservation laws of Navier-Stokes Galerkin discretizations" (2016)
         parser.add_argument('--cs', help='Use consistent SUPG stabilisation.', action='store_true')
         parser.add_argument('--cbcDelta', help='Use simpler cbcflow parameter for SUPG', action='store_true')
+        parser.add_argument('--decouple', help='Solve velocity components separately using scalar matrices (tentative '
+                                               'velocity only with --laplace and without --ema)', action='store_true')
+
+    # coefficients of extrapolation from solutions in previous time steps (newest first)
+    extrapolation_coefs = {'ext2': [[1.], [2., -1.]],
+                           'ext3': [[1.], [2., -1.], [3., -3., 1.]]}
+
+    def set_initial_guess(self, name, x):
+        """sets vector x to extrapolation from stored solutions of substep name (if --guess is ext2 or ext3)"""
+        if self.guess == 'prev' or not self.guess_history.get(name):
+            return
+        history = self.guess_history[name]
+        coefs = self.extrapolation_coefs[self.guess][len(history) - 1]
+        x.zero()
+        for c, previous in zip(coefs, history):
+            x.axpy(c, previous)
+
+    def store_solution(self, name, x, iterations):
+        """stores solution vector x of substep name for extrapolation and number of iterations used"""
+        self.iterations.setdefault(name, []).append(iterations)
+        if self.guess == 'prev':
+            return
+        history = self.guess_history.setdefault(name, [])
+        history.insert(0, x.copy())
+        del history[len(self.extrapolation_coefs[self.guess]):]
+
+    @staticmethod
+    def dirichlet_dofs(bcs, size):
+        """local indices of owned dofs (local index < size) with Dirichlet BC from any of bcs"""
+        dofs = set()
+        for bc in bcs:
+            dofs.update(bc.get_boundary_values().keys())
+        dofs = np.array(sorted(dofs), dtype=np.intc)
+        return dofs[dofs < size]
+
+    def prepare_decoupling(self, bcu):
+        """Prepares solving velocity components separately with one scalar P2 matrix (see --decouple).
+        Returns False if components have different Dirichlet boundary conditions (rows of matrix would differ)."""
+        S = self.PS
+        dim = self.V.num_sub_spaces()
+        self.split_v = FunctionAssigner([S]*dim, self.V)
+        self.merge_v = FunctionAssigner(self.V, [S]*dim)
+        self.v_components = [Function(S) for i in range(dim)]
+        self.b_components = [Function(S) for i in range(dim)]
+        self.bc_components = [Function(S) for i in range(dim)]
+        self.b_V = Function(self.V)
+        self.bc_V = Function(self.V)
+        marker = np.zeros(self.bc_V.vector().local_size())
+        marker[self.dirichlet_dofs(bcu, marker.size)] = 1.0
+        self.bc_V.vector().set_local(marker)
+        self.bc_V.vector().apply('insert')
+        self.split_v.assign(self.bc_components, self.bc_V)
+        rows = [np.where(f.vector().array() > 0.5)[0].astype(np.intc) for f in self.bc_components]
+        same_rows = all(np.array_equal(rows[0], r) for r in rows[1:])
+        if MPI.min(mpi_comm_world(), 1.0 if same_rows else 0.0) < 0.5:
+            info('Velocity components have different boundary conditions, solving without decoupling.')
+            return False
+        self.bc_rows = rows[0]
+        return True
+
+    def solve_decoupled(self, solver, A, x, bcu):
+        """Solves system with scalar matrix A for each component of velocity x, right hand side is in b_V.
+        Values of Dirichlet BC bcu (None for no BC) are applied to components of right hand side, rows of A must be
+        set by A.ident_local(bc_rows). Components share matrix and preconditioner."""
+        self.split_v.assign(self.v_components, x)
+        self.split_v.assign(self.b_components, self.b_V)
+        if bcu is not None:
+            self.bc_V.vector().zero()
+            [bc.apply(self.bc_V.vector()) for bc in bcu]
+            self.split_v.assign(self.bc_components, self.bc_V)
+            for (b, g) in zip(self.b_components, self.bc_components):
+                values = b.vector().array()
+                values[self.bc_rows] = g.vector().array()[self.bc_rows]
+                b.vector().set_local(values)
+                b.vector().apply('insert')
+        iterations = 0
+        if self.solvers == 'direct':
+            reuse = solver.parameters['reuse_factorization']
+        for i in range(len(self.v_components)):
+            if i > 0:
+                # matrix is same for all components, factorization (preconditioner) of first one is used
+                if self.solvers == 'krylov':
+                    solver.parameters['preconditioner']['structure'] = 'same'
+                else:
+                    solver.parameters['reuse_factorization'] = True
+            iterations += solver.solve(A, self.v_components[i].vector(), self.b_components[i].vector())
+        if self.solvers == 'direct':
+            solver.parameters['reuse_factorization'] = reuse
+        self.merge_v.assign(x, self.v_components)
+        return iterations
+
+    def check_cfl(self, velocity):
+        """called before tentative velocity step, hook for solvers with explicit convection (see ipcs_ab.py)"""
+        pass
+
+    def rebuild_prec_v(self):
+        """decides if preconditioner of changing matrix A1 is rebuilt in this step (lagged rebuild, see --lagV)"""
+        if self.explicit_convection:
+            return self.prec_v_age is None  # A1 is constant, preconditioner is built only once
+        if self.prec_v_age is None or self.prec_v_age >= self.lag_v:
+            return True
+        return self.iterations['solve 1'][-1] > self.lag_v_ratio * self.prec_v_iterations
+
+    def report_iterations(self):
+        average = dict((name, float(sum(its))/len(its)) for name, its in self.iterations.iteritems() if its)
+        for name in sorted(average):
+            info('Average number of iterations in %s: %.2f (initial guess: %s)' % (name, average[name], self.guess))
+        self.metadata['iterations'] = average
+        rebuilt, reused = self.solve1_times[True], self.solve1_times[False]
+        if rebuilt and reused:
+            saved = len(reused) * (sum(rebuilt)/len(rebuilt) - sum(reused)/len(reused))
+            info('Tentative velocity preconditioner rebuilt in %d of %d steps, average solve time %.4f s (rebuilt) '
+                 '%.4f s (reused), estimated time saved %.2f s' % (len(rebuilt), len(rebuilt) + len(reused),
+                                                                  sum(rebuilt)/len(rebuilt), sum(reused)/len(reused),
+                                                                  saved))
+            self.metadata['prec_v_rebuilds'] = len(rebuilt)
 
     def solve(self, problem):
         self.problem = problem
@@ -177,17 +329,16 @@ class Solver(gs.GeneralSolver):
 
         if self.use_full_SUPG:
             v1 = v + delta*0.5*k*dot(grad(v), u_ext)
-            parameters['form_compiler']['quadrature_degree'] = 6
         else:
             v1 = v
 
-        def nonlinearity(function):
+        def nonlinearity(function, velocity=u_ext):
             if self.use_ema:
-               return 2*inner(dot(sym(grad(function)), u_ext), v1) * dx + inner(div(function)*u_ext, v1) * dx
+               return 2*inner(dot(sym(grad(function)), velocity), v1) * dx + inner(div(function)*velocity, v1) * dx
                 # return 2*inner(dot(sym(grad(function)), u_ext), v) * dx + inner(div(u_ext)*function, v) * dx
                 # QQ implement this way?
             else:
-                return inner(dot(grad(function), u_ext), v1) * dx
+                return inner(dot(grad(function), velocity), v1) * dx
 
         def diffusion(fce):
             if self.useLaplace:
@@ -213,7 +364,7 @@ class Solver(gs.GeneralSolver):
                 return inner(p0, div(v1)) * dx
 
         a1_const = (1./k)*inner(u, v1)*dx + diffusion(0.5*u)
-        a1_change = nonlinearity(0.5*u)
+        a1_change = None if self.explicit_convection else nonlinearity(0.5*u)
         if self.bcv == 'DDN':
             # IMP Problem: Does not penalize influx for current step, only for the next one
             # IMP this can lead to oscilation: DDN correct next step, but then u_ext is OK so in next step DDN is not used, leading to new influx...
@@ -221,16 +372,22 @@ class Solver(gs.GeneralSolver):
             a1_change += -0.5*min_value(Constant(0.), inner(u_ext, n))*inner(u, v1)*problem.get_outflow_measure_form()
             # IMP works only with uflacs compiler
 
-        L1 = (1./k)*inner(u0, v1)*dx - nonlinearity(0.5*u0) - diffusion(0.5*u0) + pressure_rhs()
+        if self.explicit_convection:
+            # Adams-Bashforth: 1.5*N(u0) - 0.5*N(u1), where N(u) = (u.grad)u
+            L1 = (1./k)*inner(u0, v1)*dx - 1.5*nonlinearity(u0, u0) + 0.5*nonlinearity(u1, u1) - diffusion(0.5*u0) + \
+                pressure_rhs()
+        else:
+            L1 = (1./k)*inner(u0, v1)*dx - nonlinearity(0.5*u0) - diffusion(0.5*u0) + pressure_rhs()
         if self.bcv == 'DDN':
             L1 += 0.5*min_value(0., inner(u_ext, n))*inner(u0, v1)*problem.get_outflow_measure_form()
 
         # Non-consistent SUPG stabilisation
+        a1_stab = None
         if self.stabilize and not self.use_full_SUPG:
             # a1_stab = delta*inner(dot(grad(u), u_ext), dot(grad(v), u_ext))*dx
-            a1_stab = 0.5*delta*inner(dot(grad(u), u_ext), dot(grad(v), u_ext))*dx(None, {'quadrature_degree': 6})
+            a1_stab = 0.5*delta*inner(dot(grad(u), u_ext), dot(grad(v), u_ext))*dx
             # NT optional: use Crank Nicolson in stabilisation term: change RHS
-            # L1 += -0.5*delta*inner(dot(grad(u0), u_ext), dot(grad(v), u_ext))*dx(None, {'quadrature_degree': 6})
+            # L1 += -0.5*delta*inner(dot(grad(u0), u_ext), dot(grad(v), u_ext))*dx
 
         outflow_area = Constant(problem.outflow_area)
         need_outflow = Constant(0.0)
@@ -268,6 +425,7 @@ class Solver(gs.GeneralSolver):
                 F3 = (1./k)*inner(u - u_, v)*dx + inner(grad(p_ - p0), v)*dx
         a3, L3 = system(F3)
 
+        a4 = L4 = None
         if self.useRotationScheme:
             # Rotation scheme: modify pressure
             if self.bc == 'lagrange':
@@ -280,20 +438,69 @@ class Solver(gs.GeneralSolver):
             # TODO zkusit v project zadat solver_type='lu' >> primy resic by mel byt efektivnejsi
             a4, L4 = system(F4)
 
+        # boundary conditions
+        bcu, bcp = problem.get_boundary_conditions(self.bc == 'outflow', self.V, self.Q)
+
+        # velocity components solved separately: matrices of A1 (if all components are independent) and A3 are
+        # replaced by scalar ones (with same preconditioner for all components)
+        decouple_v = self.decouple and self.prepare_decoupling(bcu)
+        decouple_A1 = decouple_v and self.useLaplace and not self.use_ema
+        if decouple_v:
+            if not decouple_A1:
+                info('Tentative velocity components are coupled (needs --laplace without --ema).')
+            us = TrialFunction(self.PS)
+            vs = TestFunction(self.PS)
+            a3 = (1./k)*inner(us, vs)*dx
+            if decouple_A1:
+                v1s = vs + delta*0.5*k*dot(grad(vs), u_ext) if self.use_full_SUPG else vs
+                a1_const = (1./k)*inner(us, v1s)*dx + 0.5*nu*inner(grad(us), grad(v1s))*dx
+                a1_change = None if self.explicit_convection else 0.5*inner(dot(grad(us), u_ext), v1s)*dx
+                if self.bcv == 'DDN':  # not used now (--laplace sets bcv to NOT), same term as above for component
+                    a1_change += -0.5*min_value(Constant(0.), inner(u_ext, n))*inner(us, v1s)*\
+                        problem.get_outflow_measure_form()
+                if self.stabilize and not self.use_full_SUPG:
+                    a1_stab = 0.5*delta*inner(dot(grad(us), u_ext), dot(grad(vs), u_ext))*dx
+
+        # quadrature degree of each form is estimated and limited by --qcap (SUPG terms are not polynomial)
+        a1_const, a1_change, a1_stab, L1, a2, L2, a3, L3, a4, L4 = \
+            [self.limit_degree(form) for form in [a1_const, a1_change, a1_stab, L1, a2, L2, a3, L3, a4, L4]]
+        info('Quadrature degrees: A1 %s, A1 change %s, A1 stab %s, L1 %s' %
+             tuple(degrees(form) if form is not None else '-' for form in [a1_const, a1_change, a1_stab, L1]))
+
         # Assemble matrices
         self.tc.start('assembleMatrices')
-        A1_const = assemble(a1_const)  # need to be here, so A1 stays one Python object during repeated assembly
-        A1_change = A1_const.copy()  # copy to get matrix with same sparse structure (data will be overwriten)
+        # need to be here, so A1 stays one Python object during repeated assembly
+        if decouple_A1:
+            A1_const = self.assemble_constant_matrix('A1_const_scalar', a1_const, self.PS)
+        else:
+            A1_const = self.assemble_constant_matrix('A1_const', a1_const, self.V)
+        if not self.explicit_convection:
+            A1_change = A1_const.copy()  # copy to get matrix with same sparse structure (data will be overwriten)
         if self.stabilize and not self.use_full_SUPG:
             A1_stab = A1_const.copy()  # copy to get matrix with same sparse structure (data will be overwriten)
-        A2 = assemble(a2)
-        A3 = assemble(a3)
+        A2 = self.assemble_constant_matrix('A2', a2, QL if self.bc == 'lagrange' else self.Q)
+        if decouple_v:
+            A3 = self.assemble_constant_matrix('A3_scalar', a3, self.PS)
+            if not self.B:
+                A3.ident_local(self.bc_rows)
+        else:
+            A3 = self.assemble_constant_matrix('A3', a3, self.V)
         if self.useRotationScheme:
-            A4 = assemble(a4)
+            A4 = self.assemble_constant_matrix('A4', a4, self.Q)
+        # Dirichlet rows of constant matrices are set once, in time steps BC values are applied only to rhs
+        [bc.apply(A2) for bc in bcp]
+        if not self.B and not decouple_v:
+            [bc.apply(A3) for bc in bcu]
+        if not decouple_A1:
+            bcu_rows = self.dirichlet_dofs(bcu, u_.vector().local_size())  # rows of A1 set in every step
+        if self.explicit_convection:
+            A1_const.ident_local(self.bc_rows if decouple_A1 else bcu_rows)
         self.tc.end('assembleMatrices')
 
         if self.solvers == 'direct':
             self.solver_vel_tent = LUSolver('mumps')
+            if self.explicit_convection:
+                self.solver_vel_tent.parameters['reuse_factorization'] = True
             self.solver_vel_cor = LUSolver('mumps')
             self.solver_p = LUSolver('umfpack')
             if self.useRotationScheme:
@@ -356,8 +563,10 @@ class Solver(gs.GeneralSolver):
         if self.bc == 'lagrange':
             fa = FunctionAssigner(self.Q, QL.sub(0))
 
-        # boundary conditions
-        bcu, bcp = problem.get_boundary_conditions(self.bc == 'outflow', self.V, self.Q)
+        if self.recycle > 0 and self.solvers == 'krylov':
+            info('Pressure initial guess projected onto %d previous solutions.' % self.recycle)
+            self.p_projection = gs.ProjectedInitialGuess(A2, self.recycle)
+
         self.tc.end('init')
         # Time-stepping
         info("Running of Incremental pressure correction scheme n. 1")
@@ -381,9 +590,12 @@ class Solver(gs.GeneralSolver):
 
             # assemble matrix (it depends on solution)
             self.tc.start('assembleA1')
-            assemble(a1_change, tensor=A1_change)  # assembling into existing matrix is faster than assembling new one
-            A1 = A1_const.copy()  # we dont want to change A1_const
-            A1.axpy(1, A1_change, True)
+            if self.explicit_convection:
+                A1 = A1_const  # constant matrix with Dirichlet rows already set
+            else:
+                assemble(a1_change, tensor=A1_change)  # assembling into existing matrix is faster than assembling new one
+                A1 = A1_const.copy()  # we dont want to change A1_const
+                A1.axpy(1, A1_change, True)
             self.tc.end('assembleA1')
             self.tc.start('assembleA1stab')
             if self.stabilize and not self.use_full_SUPG:
@@ -394,15 +606,41 @@ class Solver(gs.GeneralSolver):
             # Compute tentative velocity step
             begin("Computing tentative velocity")
             self.tc.start('rhs')
-            b = assemble(L1)
+            if decouple_A1:
+                assemble(L1, tensor=self.b_V.vector())
+            else:
+                b = assemble(L1)
             self.tc.end('rhs')
             self.tc.start('applybc1')
-            [bc.apply(A1, b) for bc in bcu]
+            if not decouple_A1:
+                if not self.explicit_convection:
+                    A1.ident_local(bcu_rows)
+                [bc.apply(b) for bc in bcu]
+            elif not self.explicit_convection:
+                A1.ident_local(self.bc_rows)  # BC values are applied to rhs in solve_decoupled()
             self.tc.end('applybc1')
             try:
+                self.check_cfl(u0)
+                self.set_initial_guess('solve 1', u_.vector())
+                if self.solvers == 'krylov':
+                    rebuild = self.rebuild_prec_v()
+                    self.solver_vel_tent.parameters['preconditioner']['structure'] = \
+                        'same_nonzero_pattern' if rebuild else 'same'
+                start = toc()
                 self.tc.start('solve 1')
-                self.solver_vel_tent.solve(A1, u_.vector(), b)
+                if decouple_A1:
+                    iterations = self.solve_decoupled(self.solver_vel_tent, A1, u_, bcu)
+                else:
+                    iterations = self.solver_vel_tent.solve(A1, u_.vector(), b)
                 self.tc.end('solve 1')
+                self.store_solution('solve 1', u_.vector(), iterations)
+                if self.solvers == 'krylov':
+                    self.solve1_times[rebuild].append(toc() - start)
+                    if rebuild:
+                        self.prec_v_age = 1
+                        self.prec_v_iterations = iterations
+                    else:
+                        self.prec_v_age += 1
                 if save_this_step:
                     self.tc.start('saveVel')
                     problem.save_vel(True, u_, t)
@@ -436,17 +674,22 @@ class Solver(gs.GeneralSolver):
             b = assemble(L2)
             self.tc.end('rhs')
             self.tc.start('applybcP')
-            [bc.apply(A2, b) for bc in bcp]
+            [bc.apply(b) for bc in bcp]
             if self.bc in ['nullspace', 'nullspace_s']:
                 self.null_space.orthogonalize(b)
             self.tc.end('applybcP')
             try:
+                p_vector = p_QL.vector() if self.bc == 'lagrange' else p_.vector()
                 self.tc.start('solve 2')
-                if self.bc == 'lagrange':
-                    self.solver_p.solve(A2, p_QL.vector(), b)
+                if self.p_projection is not None:
+                    self.p_projection.guess(p_vector, b)
                 else:
-                    self.solver_p.solve(A2, p_.vector(), b)
+                    self.set_initial_guess('solve 2', p_vector)
+                iterations = self.solver_p.solve(A2, p_vector, b)
+                if self.p_projection is not None:
+                    self.p_projection.add(p_vector)
                 self.tc.end('solve 2')
+                self.store_solution('solve 2', p_vector, iterations)
             except RuntimeError as inst:
                 problem.report_fail(t)
                 return 1
@@ -477,16 +720,24 @@ class Solver(gs.GeneralSolver):
 
             begin("Computing corrected velocity")
             self.tc.start('rhs')
-            b = assemble(L3)
+            if decouple_v:
+                assemble(L3, tensor=self.b_V.vector())
+            else:
+                b = assemble(L3)
             self.tc.end('rhs')
-            if not self.B:
+            if not self.B and not decouple_v:
                 self.tc.start('applybc3')
-                [bc.apply(A3, b) for bc in bcu]
+                [bc.apply(b) for bc in bcu]
                 self.tc.end('applybc3')
             try:
+                self.set_initial_guess('solve 3', u_cor.vector())
                 self.tc.start('solve 3')
-                self.solver_vel_cor.solve(A3, u_cor.vector(), b)
+                if decouple_v:
+                    iterations = self.solve_decoupled(self.solver_vel_cor, A3, u_cor, None if self.B else bcu)
+                else:
+                    iterations = self.solver_vel_cor.solve(A3, u_cor.vector(), b)
                 self.tc.end('solve 3')
+                self.store_solution('solve 3', u_cor.vector(), iterations)
                 problem.compute_err(False, u_cor, t)
                 problem.compute_div(False, u_cor)
             except RuntimeError as inst:
@@ -512,9 +763,11 @@ class Solver(gs.GeneralSolver):
                 b = assemble(L4)
                 self.tc.end('rhs')
                 try:
+                    self.set_initial_guess('solve 4', p_mod.vector())
                     self.tc.start('solve 4')
-                    self.solver_rot.solve(A4, p_mod.vector(), b)
+                    iterations = self.solver_rot.solve(A4, p_mod.vector(), b)
                     self.tc.end('solve 4')
+                    self.store_solution('solve 4', p_mod.vector(), iterations)
                 except RuntimeError as inst:
                     problem.report_fail(t)
                     return 1
@@ -546,5 +799,6 @@ class Solver(gs.GeneralSolver):
             self.tc.end('next')
 
         info("Finished: Incremental pressure correction scheme n. 1")
+        self.report_iterations()
         problem.report()
         return 0
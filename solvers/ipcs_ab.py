@@ -0,0 +1,44 @@
+from __future__ import print_function
+from dolfin import FunctionSpace, assemble, CellSize
+from dolfin.cpp.common import info, MPI, mpi_comm_world
+from dolfin.functions import TestFunction, Constant
+from ufl import dx, inner, sqrt
+
+import ipcs1
+
+
+class Solver(ipcs1.Solver):
+    explicit_convection = True
+
+    def __init__(self, args, tc, metadata):
+        ipcs1.Solver.__init__(self, args, tc, metadata)
+        if self.stabilize or self.bcv == 'DDN':
+            exit('Stabilization and DDN boundary condition depend on extrapolated velocity and are not implemented in '
+                 'ipcs_ab, use ipcs1.')
+        self.cfl_limit = args.cfl
+        self.cfl_form = None
+        self.cell_volumes = None
+
+    def __str__(self):
+        return 'ipcs_ab - incremental pressure correction scheme with nonlinearity treated explicitly by ' \
+               'Adams-Bashforth and viscosity term treated semi-explicitly (Crank-Nicholson)'
+
+    @staticmethod
+    def setup_parser_options(parser):
+        ipcs1.Solver.setup_parser_options(parser)
+        parser.add_argument('--cfl', help='Stop computation when CFL number exceeds given limit (0: no check)',
+                            type=float, default=0.)
+
+    def check_cfl(self, velocity):
+        # explicit convection is stable only for CFL number (cellwise |u|*dt/h) under a limit
+        if self.cfl_limit <= 0.:
+            return
+        if self.cfl_form is None:
+            mesh = self.problem.mesh
+            q = TestFunction(FunctionSpace(mesh, 'DG', 0))
+            self.cell_volumes = assemble(q*dx).array()
+            self.cfl_form = Constant(self.metadata['dt'])*sqrt(inner(velocity, velocity))/CellSize(mesh)*q*dx
+        cfl = MPI.max(mpi_comm_world(), (assemble(self.cfl_form).array()/self.cell_volumes).max())
+        info('CFL number: %f' % cfl)
+        if cfl > self.cfl_limit:
+            raise RuntimeError('STOPPED: CFL number %f exceeds limit %f!' % (cfl, self.cfl_limit))
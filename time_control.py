@@ -7,6 +7,8 @@ class TimeControl:
         info('Initializing Time control')
         # watch is list [total_time, last_start, message_when_measured, count into total time]
         self.watches = {}
+        # counter is list [total count, number of counted steps, message], reported with watches
+        self.counters = {}
         self.last_measurement = 0
         self.measuring = 0
         tic()
@@ -26,6 +28,16 @@ class TimeControl:
             if from_last > 0.1:
                 info('TC (%s): time from last end of measurement: %f' % (what, from_last))
 
+    def init_counter(self, what, message):
+        if what not in self.counters:
+            self.counters[what] = [0, 0, message]
+
+    def count(self, what, number):
+        """adds number counted in one step (e.g. iterations of solver)"""
+        counter = self.counters[what]
+        counter[0] += number
+        counter[1] += 1
+
     def end(self, what):
         watch = self.watches[what]
         elapsed = toc() - watch[1]
@@ -86,6 +98,14 @@ class TimeControl:
             report_data.append(value[0]/total_time)
         report_header.append('part unmeasured')
         report_data.append((total_time-sum)/total_time)
+        for key in sorted(self.counters.iterkeys()):
+            value = self.counters[key]
+            per_step = float(value[0])/value[1] if value[1] else 0.0
+            info('   %-40s: %12d   %.2f per step' % (value[2], value[0], per_step))
+            report_header.append(value[2])
+            report_header.append('per step '+value[2])
+            report_data.append(value[0])
+            report_data.append(per_step)
         if report_file is not None:
             writer = csv.writer(report_file, delimiter=';', quotechar='|', quoting=csv.QUOTE_NONE)
             writer.writerow(report_header)
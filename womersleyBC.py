@@ -2,35 +2,42 @@ from __future__ import print_function
 
 __author__ = 'jh'
 from dolfin import Expression, near, pi
-from sympy import I, re, sqrt, exp, symbols, lambdify, besselj
+import numpy as np
 from scipy.special import jv
 
+# Analytic Womersley solution in cylinder of radius R (velocity and pressure gradient in z direction), factor = 1:
+#   u(r, t) = u_max - u_par*r^2 + sum_k mult_k*(bes_mult_k*J_0(bes_k*r) + 1)*exp(i*pi*exp_k*t)
+#   dp/dz(t) = -(pg_mean + sum_k pg_k*exp(i*pi*pg_exp_k*t))
+# coefficients form complex conjugate pairs, so u and dp/dz are real
+# coefficients were generated and checked by womersley_coefficients.py (sympy is needed only there)
 R = 5.0
-r, tm = symbols('r tm')
-u = (-43.2592 * r ** 2 +
-     (-11.799 + 0.60076 * I) * ((0.000735686 - 0.000528035 * I)
-                                * besselj(0, r * (1.84042 + 1.84042 * I)) + 1) * exp(-8 * I * pi * tm) +
-     (-11.799 - 0.60076 * I) * ((0.000735686 + 0.000528035 * I)
-                                * besselj(0, r * (1.84042 - 1.84042 * I)) + 1) * exp(8 * I * pi * tm) +
-     (-26.3758 - 4.65265 * I) * (-(0.000814244 - 0.00277126 * I)
-                                 * besselj(0, r * (1.59385 - 1.59385 * I)) + 1) * exp(6 * I * pi * tm) +
-     (-26.3758 + 4.65265 * I) * (-(0.000814244 + 0.00277126 * I)
-                                 * besselj(0, r * (1.59385 + 1.59385 * I)) + 1) * exp(-6 * I * pi * tm) +
-     (-51.6771 + 27.3133 * I) * (-(0.0110653 - 0.00200668 * I)
-                                 * besselj(0, r * (1.30138 + 1.30138 * I)) + 1) * exp(-4 * I * pi * tm) +
-     (-51.6771 - 27.3133 * I) * (-(0.0110653 + 0.00200668 * I)
-                                 * besselj(0, r * (1.30138 - 1.30138 * I)) + 1) * exp(4 * I * pi * tm) +
-     (-33.1594 - 95.2423 * I) * ((0.0314408 - 0.0549981 * I)
-                                 * besselj(0, r * (0.920212 - 0.920212 * I)) + 1) * exp(2 * I * pi * tm) +
-     (-33.1594 + 95.2423 * I) * ((0.0314408 + 0.0549981 * I)
-                                 * besselj(0, r * (0.920212 + 0.920212 * I)) + 1) * exp(
-          -2 * I * pi * tm) + 1081.48)
-# how this works?
-u_lambda = lambdify([r, tm], u, ['numpy', {'besselj': jv}])
+u_max = 1081.48
+u_par = 43.2592
+mult = np.array([-11.799 + 0.60076j, -11.799 - 0.60076j, -26.3758 - 4.65265j, -26.3758 + 4.65265j,
+                 -51.6771 + 27.3133j, -51.6771 - 27.3133j, -33.1594 - 95.2423j, -33.1594 + 95.2423j])
+bes_mult = np.array([0.000735686 - 0.000528035j, 0.000735686 + 0.000528035j, -0.000814244 + 0.00277126j,
+                     -0.000814244 - 0.00277126j, -0.0110653 + 0.00200668j, -0.0110653 - 0.00200668j,
+                     0.0314408 - 0.0549981j, 0.0314408 + 0.0549981j])
+bes = np.array([1.84042 + 1.84042j, 1.84042 - 1.84042j, 1.59385 - 1.59385j, 1.59385 + 1.59385j,
+                1.30138 + 1.30138j, 1.30138 - 1.30138j, 0.920212 - 0.920212j, 0.920212 + 0.920212j])
+exp_k = np.array([-8, 8, 6, -6, -4, 4, 2, -2])
+pg_mean = 641.967
+pg = np.array([15.0987 - 296.542j, 87.7004 - 497.173j, 343.229 - 649.393j, 598.425 - 208.347j,
+               598.425 + 208.347j, 343.229 + 649.393j, 87.7004 + 497.173j, 15.0987 + 296.542j])
+pg_exp = np.array([8, 6, 4, 2, -2, -4, -6, -8])
+
+
+def analytic_velocity(r, t):
+    """z component of velocity (factor = 1), vectorized over radius r and time t (broadcast against each other)"""
+    r, t = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(t, dtype=float))
+    r = r[..., np.newaxis]
+    modes = mult * (bes_mult * jv(0, r * bes) + 1) * np.exp(1j * pi * exp_k * t[..., np.newaxis])
+    value = u_max - u_par * r[..., 0] * r[..., 0] + modes.sum(axis=-1).real
+    return value if value.ndim else float(value)
 
 
 def average_analytic_velocity(factor):
-    return 1081.48 * factor
+    return u_max * factor
 
 
 def average_analytic_velocity_expr(factor):
@@ -47,26 +54,25 @@ class WomersleyProfile(Expression):
         self.factor = factor
 
     def eval(self, value, x):
-        rad = float(sqrt(x[0] * x[0] + x[1] * x[
-            1]))  # conversion to float needed, u_lambda (and near) cannot use sympy Float as input
+        rad = np.sqrt(x[0] * x[0] + x[1] * x[1])
         value[0] = 0
         value[1] = 0
-        value[2] = 0 if near(rad, R) else re(self.factor * u_lambda(rad, self.t))  # do not evaluate on boundaries, it's 0
+        value[2] = 0 if near(rad, R) else self.factor * analytic_velocity(rad, self.t)  # do not evaluate on boundaries, it's 0
         # print(x[0], x[1], x[2], rad, value[2])
 
     def value_shape(self):
         return (3,)
 
-p = -re(641.967 + (15.0987 - 296.542*I)*exp(8*I*pi*tm) + (87.7004 - 497.173*I)*exp(6*I*pi*tm) + (343.229 - 649.393*I)*exp(4*I*pi*tm) + (598.425 - 208.347*I)*exp(2*I*pi*tm) + (598.425 + 208.347*I)*exp(-2*I*pi*tm) + (343.229 + 649.393*I)*exp(-4*I*pi*tm) + (87.7004 + 497.173*I)*exp(-6*I*pi*tm) + (15.0987 + 296.542*I)*exp(-8*I*pi*tm))
-p_lambda = lambdify([tm], p)
-
 
 def average_analytic_pressure_grad(factor):
-    return 641.967 * factor
+    return pg_mean * factor
 
 
 def analytic_pressure_grad(factor, t):
-    return factor * p_lambda(t)
+    """vectorized over time t"""
+    t = np.asarray(t, dtype=float)
+    value = -factor * (pg_mean + (pg * np.exp(1j * pi * pg_exp * t[..., np.newaxis])).sum(axis=-1).real)
+    return value if value.ndim else float(value)
 
 
 def average_analytic_pressure_expr(factor):
@@ -76,4 +82,4 @@ def average_analytic_pressure_expr(factor):
 
 def analytic_pressure(factor, t):
     gradient = analytic_pressure_grad(factor, t)
-    return Expression("grad*x[2]", grad=gradient)
\ No newline at end of file
+    return Expression("grad*x[2]", grad=gradient)
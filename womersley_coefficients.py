@@ -0,0 +1,68 @@
+from __future__ import print_function
+
+__author__ = 'jh'
+import csv
+import sys
+import numpy as np
+from math import pi
+from sympy import I, re, exp, symbols, lambdify, besselj, sympify, N
+from scipy.special import jv
+
+# Offline tool for coefficients of analytic Womersley solution used in womersleyBC.py (only place where sympy is used)
+#   python womersley_coefficients.py            checks womersleyBC against symbolic solution
+#   python womersley_coefficients.py tmp.csv    prints velocity coefficients from Mathematica output (format used by
+#                                               generate.py) as NumPy arrays for womersleyBC.py
+
+r, tm = symbols('r tm')
+u = (-43.2592 * r ** 2 +
+     (-11.799 + 0.60076 * I) * ((0.000735686 - 0.000528035 * I)
+                                * besselj(0, r * (1.84042 + 1.84042 * I)) + 1) * exp(-8 * I * pi * tm) +
+     (-11.799 - 0.60076 * I) * ((0.000735686 + 0.000528035 * I)
+                                * besselj(0, r * (1.84042 - 1.84042 * I)) + 1) * exp(8 * I * pi * tm) +
+     (-26.3758 - 4.65265 * I) * (-(0.000814244 - 0.00277126 * I)
+                                 * besselj(0, r * (1.59385 - 1.59385 * I)) + 1) * exp(6 * I * pi * tm) +
+     (-26.3758 + 4.65265 * I) * (-(0.000814244 + 0.00277126 * I)
+                                 * besselj(0, r * (1.59385 + 1.59385 * I)) + 1) * exp(-6 * I * pi * tm) +
+     (-51.6771 + 27.3133 * I) * (-(0.0110653 - 0.00200668 * I)
+                                 * besselj(0, r * (1.30138 + 1.30138 * I)) + 1) * exp(-4 * I * pi * tm) +
+     (-51.6771 - 27.3133 * I) * (-(0.0110653 + 0.00200668 * I)
+                                 * besselj(0, r * (1.30138 - 1.30138 * I)) + 1) * exp(4 * I * pi * tm) +
+     (-33.1594 - 95.2423 * I) * ((0.0314408 - 0.0549981 * I)
+                                 * besselj(0, r * (0.920212 - 0.920212 * I)) + 1) * exp(2 * I * pi * tm) +
+     (-33.1594 + 95.2423 * I) * ((0.0314408 + 0.0549981 * I)
+                                 * besselj(0, r * (0.920212 + 0.920212 * I)) + 1) * exp(
+          -2 * I * pi * tm) + 1081.48)
+u_lambda = lambdify([r, tm], u, ['numpy', {'besselj': jv}])
+
+p = -re(641.967 + (15.0987 - 296.542*I)*exp(8*I*pi*tm) + (87.7004 - 497.173*I)*exp(6*I*pi*tm) + (343.229 - 649.393*I)*exp(4*I*pi*tm) + (598.425 - 208.347*I)*exp(2*I*pi*tm) + (598.425 + 208.347*I)*exp(-2*I*pi*tm) + (343.229 + 649.393*I)*exp(-4*I*pi*tm) + (87.7004 + 497.173*I)*exp(-6*I*pi*tm) + (15.0987 + 296.542*I)*exp(-8*I*pi*tm))
+p_lambda = lambdify([tm], p)
+
+
+def check():
+    import womersleyBC
+    radii = np.linspace(0, womersleyBC.R, 51)
+    times = np.linspace(0, 1, 101)
+    rr, tt = np.meshgrid(radii, times)
+    symbolic = np.vectorize(lambda rad, t: complex(u_lambda(rad, t)).real)(rr, tt)
+    print('max velocity difference:', np.abs(womersleyBC.analytic_velocity(rr, tt) - symbolic).max())
+    symbolic = np.array([float(p_lambda(t)) for t in times])
+    print('max pressure gradient difference:', np.abs(womersleyBC.analytic_pressure_grad(1.0, times) - symbolic).max())
+
+
+def print_coefficients(fname):
+    infile = open(fname, 'r')
+    csvreader = csv.reader(infile, delimiter=',')
+    next(csvreader)  # number of coefficients
+    for name in ['mult', 'bes_mult', 'bes']:
+        values = [complex(N(sympify(i.replace('*^', 'E')))) for i in next(csvreader)]
+        print('%s = np.array([%s])' % (name, ', '.join(repr(v) for v in values)))
+    print('u_max =', float(N(sympify(next(csvreader)[0].replace('*^', 'E')))))
+    print('u_par =', float(N(sympify(next(csvreader)[0].replace('*^', 'E')))))
+    infile.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print_coefficients(sys.argv[1])
+    else:
+        check()